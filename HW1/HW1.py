@@ -7,32 +7,46 @@ i. main - runs all of the functions
     ii. get_trainandtest_vocabanddocs() - converts dataset into tokens (stemmed and unstemmed), creates megatraining document and extracts vocabulary
     iii. get_vectors() - creates BOW and TFIDF vectors for test and train both stemmed and unstemmed
     iv. get_class_priors() - calculates the class prior likelihoods for use in Naive Bayes predictions
-    v. get_perword_likelihood() - calculates dictionaries for each feature vector to be used in the Naive Bayes prediction calculation
+    v. get_perword_likelihood() - calculates likelihood arrays for each feature vector to be used in the Naive Bayes prediction calculation
     vi. predict_NB() - predicts the class of all of the test documents for all of the feature vectors using Naive Bayes
-    vii. evaluate - returns accuracy and confusion matrix for predictions 
+    vii. evaluate - returns accuracy and confusion matrix for predictions (evaluate_all does every model at once and writes results.txt)
     viii. Logistic_Regression_L2_SGD - logistic regression model class used to create the model and form predictions on test vectors
+    ix. ingest_new_reviews() - adds new reviews in Data to the stored documents, vectors and Naive Bayes likelihoods without rebuilding them
 
-Due to the size of the dataset, and the number of tokens we are required to keep, many of the operations when creating vectors utilize a large amount of RAM. 
-This code was tested on a machine with 64GB of DDR4 RAM. Variables are deleted throughout when they are not needed to save memory. Needed data structures are saved and loaded
-for later use.
+Due to the size of the dataset, and the number of tokens we are required to keep, the vectors are stored as sparse CSR matrices.
+Only the nonzero counts of each document are kept, so the vectors for the whole corpus fit in a few hundred MB of RAM. Needed data structures
+are saved and loaded for later use.
 """
 import os
 import pandas as pd
 import re
 import time
 import numpy as np
+from scipy import sparse
 import itertools
 from nltk.stem.porter import PorterStemmer
+from stemcache import StemCache
+from corpusreader import list_corpus, read_file
+from packedcorpus import PackedCorpus, TokenTable
 from nltk import word_tokenize
-from collections import defaultdict
+import nltk
+from collections import defaultdict, deque
+from multiprocessing import Pool
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
 from sklearn.metrics import confusion_matrix
 import string
 import pickle
+import json
+import hashlib
+import inspect
+import zlib
 
 #emoji regex
 start_time = time.time()
 emoticon_string = r"(:\)|:-\)|:\(|:-\(|;\);-\)|:-O|8-|:P|:D|:\||:S|:\$|:@|8o\||\+o\(|\(H\)|\(C\)|\(\?\))"
 #https://www.regexpal.com/96995
+porter_stemmer = StemCache(PorterStemmer()) #shared stem cache -- each word is only stemmed once per process
 
 #pickeling code for saving objects
 def save_obj(name, obj ):
@@ -43,100 +57,428 @@ def load_obj(name ):
     with open( name + '.pkl', 'rb') as f:
         return pickle.load(f)
 
-def main(method='NB'):
+#vocabulary dictionaries -- a Hashing_Vectorizer is saved as its settings (plain data) instead of pickling the class,
+#so loading it doesn't depend on the module the class was pickled from
+def save_vocab_dict(name, vocab_dict):
+    if isinstance(vocab_dict, Hashing_Vectorizer):
+        vocab_dict = ('Hashing_Vectorizer', vocab_dict.n_buckets, vocab_dict.signed)
+    save_obj(name, vocab_dict)
+
+def load_vocab_dict(name):
+    # the vocabulary dictionary saved with save_vocab_dict, or the Hashing_Vectorizer if the vectors were hashed
+    vocab_dict = load_obj(name)
+    if isinstance(vocab_dict, tuple):
+        return Hashing_Vectorizer(*vocab_dict[1:])
+    return vocab_dict
+
+#memory-mapped storage for the sparse vectors
+def save_sparse(name, matrix):
+    '''
+    Saves a CSR matrix as a folder of .npy files (data, indices, indptr and shape) that load_sparse can memory-map.
+    '''
+    os.makedirs(name, exist_ok=True)
+    for array_name in ['data', 'indices', 'indptr']:
+        np.save(os.path.join(name, array_name), getattr(matrix, array_name))
+    np.save(os.path.join(name, 'shape'), np.array(matrix.shape))
+
+def load_sparse(name, mmap_mode='r'):
+    '''
+    Opens a CSR matrix saved with save_sparse. The arrays are memory-mapped, so nothing is read until it is used and
+    slicing rows only pages in those rows. The pages are shared by every process that opens the same matrix.
+    mmap_mode=None reads the whole matrix into memory.
+    '''
+    data, indices, indptr = [np.load(os.path.join(name, array_name + '.npy'), mmap_mode=mmap_mode) for array_name in ['data', 'indices', 'indptr']]
+    shape = tuple(np.load(os.path.join(name, 'shape.npy')))
+    return sparse.csr_matrix((data, indices, indptr), shape=shape, copy=False)
+
+class StageCache:
+    """ Content addressed cache for the intermediate results that main saves in Stored/.
+    Each stage has a key that is a hash of everything it depends on -- the keys of the stages it reads from,
+    its parameters and the source code of the functions that create it. The key of every finished stage and
+    the files it saved are kept in a json manifest. A stage is skipped if its key matches the manifest and all
+    of its files still exist, so changing the reviews, a parameter or the code reruns that stage and every
+    stage after it.
+
+    The parameters are:
+        manifest: path of the json manifest
+    """
+
+    def __init__(self, manifest='Stored/stage_cache.json'):
+        self.manifest = manifest
+        self.stages = {}
+        if os.path.exists(manifest):
+            with open(manifest) as f:
+                self.stages = json.load(f)
+
+    @staticmethod
+    def get_key(*inputs):
+        # hash of the inputs -- functions and classes are hashed by their source code
+        key = hashlib.sha1()
+        for item in inputs:
+            if inspect.isfunction(item) or inspect.isclass(item):
+                item = inspect.getsource(item)
+            key.update(json.dumps(item, sort_keys=True, default=str).encode('utf8'))
+        return key.hexdigest()
+
+    def is_current(self, stage, key):
+        stored = self.stages.get(stage)
+        return stored is not None and stored['key'] == key and all(os.path.exists(f) for f in stored['outputs'])
+
+    def record(self, stage, key, outputs):
+        self.stages[stage] = {'key': key, 'outputs': outputs}
+        with open(self.manifest, 'w') as f:
+            json.dump(self.stages, f, indent=1)
+
+    def run(self, stage, key, outputs, function, *args):
+        # runs function(*args) unless the stage is still valid and records the stage once it finishes
+        if self.is_current(stage, key):
+            print("%s Loaded From Cache --- %s minutes ---" % (stage, round((time.time() - start_time)/60,2)))
+        else:
+            function(*args)
+            self.record(stage, key, outputs)
+        return key
+
+def get_folder_fingerprint(folder):
+    '''
+    The path, size and modification time of every file under folder. Used in the key of the tokenizing stage so
+    that adding, removing or editing a review invalidates the stored documents.
+    '''
+    fingerprint = []
+    for root, dirs, files in os.walk(folder):
+        dirs.sort()
+        for f in sorted(files):
+            stat = os.stat(os.path.join(root, f))
+            fingerprint.append((os.path.relpath(os.path.join(root, f), folder), stat.st_size, stat.st_mtime_ns))
+    return fingerprint
+
+# naive bayes models evaluated in main, in the order predict_NB returns them
+NB_models = ["NB-NOSTEM-FREQ", "NB-NOSTEM-BINARY", "NB-NOSTEM-TFIDF", "NB-STEM-FREQ", "NB-STEM-BINARY", "NB-STEM-TFIDF"]
+
+# logistic regression models evaluated in main -- (name, saved model, train vectors, model parameters)
+# the test vectors have the same name as the train vectors with train replaced by test
+# the models run every iteration, add e.g. tol=1e-4 to the parameters of a model to stop it early (see Logistic_Regression_L2_SGD)
+LR_models = [("LOGISTIC_FREQ_NOL2", 'LR-bowfreq-noL2', 'trainbow_freq', dict(n_iter=15, eta=1, batch_size=10000)),
+             ("LOGISTIC_BINARY_NOL2", 'LR-bowbinary-noL2', 'trainbow_binary', dict(n_iter=15, eta=1, batch_size=10000)),
+             ("LOGISTIC_TFIDF_NOL2", 'LR-tfidf-noL2', 'train_tfidf', dict(n_iter=15, eta=1, batch_size=10000)),
+             ("LOGISTIC_FREQ_STEM_NOL2", 'LR-bowfreq-stem-noL2', 'trainbow_stem_freq', dict(n_iter=15, eta=1, batch_size=10000)),
+             ("LOGISTIC_BINARY_STEM_NOL2", 'LR-bowbinary-stem-noL2', 'trainbow_stem_binary', dict(n_iter=15, eta=1, batch_size=10000)),
+             ("LOGISTIC_TFIDF_STEM_NOL2", 'LR-tfidf-stem-noL2', 'train_tfidf_stem', dict(n_iter=15, eta=1, batch_size=10000)),
+             ("LOGISTIC_FREQ_L2", 'LR-bowfreq-L2', 'trainbow_freq', dict(n_iter=15, eta=0.1, l2=5, batch_size=10000)),
+             ("LOGISTIC_BINARY_L2", 'LR-bowbinary-L2', 'trainbow_binary', dict(n_iter=15, eta=0.1, l2=5, batch_size=10000)),
+             ("LOGISTIC_TFIDF_L2", 'LR-tfidf-L2', 'train_tfidf', dict(n_iter=15, eta=0.1, l2=5, batch_size=10000)),
+             ("LOGISTIC_FREQ_STEM_L2", 'LR-bowfreq-stem-L2', 'trainbow_stem_freq', dict(n_iter=15, eta=0.1, l2=5, batch_size=10000)),
+             ("LOGISTIC_BINARY_STEM_L2", 'LR-bowbinary-stem-L2', 'trainbow_stem_binary', dict(n_iter=15, eta=0.1, l2=5, batch_size=10000)),
+             ("LOGISTIC_TFIDF_STEM_L2", 'LR-tfidf-stem-L2', 'train_tfidf_stem', dict(n_iter=15, eta=0.1, l2=5, batch_size=10000))]
+
+# files saved by each stage of main
+docs_outputs = (['Stored/DocsVocab/%s' % f for f in ['trainingdocs', 'trainingdocs_stemmed', 'testdocs', 'testdocs_stemmed']]
+                + ['Stored/DocsVocab/%s.npy' % f for f in ['vocabulary_blob', 'vocabulary_offsets', 'vocabulary_stemmed_blob',
+                                                           'vocabulary_stemmed_offsets', 'y_train', 'y_test']]
+                + ['Stored/DocsVocab/ingested_files.pkl'])
+vector_names = ['trainbow_freq', 'trainbow_stem_freq', 'testbow_freq', 'testbow_stem_freq',
+                'trainbow_binary', 'trainbow_stem_binary', 'testbow_binary', 'testbow_stem_binary',
+                'train_tfidf', 'train_tfidf_stem', 'test_tfidf', 'test_tfidf_stem']
+vectors_outputs = (['Stored/Vectors/%s' % f for f in vector_names]
+                   + ['Stored/Vectors/idf.npy', 'Stored/Vectors/idf_stem.npy',
+                      'Stored/DocsVocab/vocab_dict.pkl', 'Stored/DocsVocab/stem_vocab_dict.pkl'])
+likelihoods_outputs = ['Stored/Likelihoods/likelihoods.npz', 'Stored/Likelihoods/nb_stats.npz']
+# number of hash buckets of the vectors, None gives one column per vocabulary word (see Hashing_Vectorizer)
+hashing_buckets = None
+# with hashing_buckets, the Logistic Regression vectors are made with signed hashing and saved as Stored/Vectors/signed_*
+# (see LR_vectors_file) -- Naive Bayes always uses the unsigned counts
+hashing_signed = False
+# options of the TFIDF vectors (see TFIDF_Transformer)
+tfidf_options = dict(sublinear_tf=False, norm=None)
+
+def main(method='NB', use_cache=True, n_jobs=None):
     '''
     The main function can be utilized to create vectors, vocabulary, likelihoods for NB, test set predictions and test set evaluation. 
-    Comment out the creation steps and merely evaluate the results on the saved data to save time.
+    Each creation step is only run when its stored results are out of date (see StageCache), so rerunning main after
+    changing the classifier does not tokenize the reviews again. Set use_cache=False to rerun every step.
+    n_jobs is the number of processes used to tokenize the reviews and to train the Logistic Regression models (None = number of cpus).
     '''
 
     print("Start Program --- %s minutes ---" % (round((time.time() - start_time)/60,2)))
+    cache = StageCache()
+    if not use_cache:
+        cache.stages = {}
 
     # create vocabulary, tokenize dataset, create vectors, and store perword likelihoods by class
-    get_trainandtest_vocabanddocs()
-    get_vectors()
+    docs_key, vectors_key, likelihoods_key = get_stage_keys()
+    cache.run('Docs', docs_key, docs_outputs, get_trainandtest_vocabanddocs, n_jobs)
+    cache.run('Vectors', vectors_key, get_vectors_outputs(), get_vectors)
     P_positive, P_negative  = get_class_priors()
-    get_perword_likelihood()
+    cache.run('Likelihoods', likelihoods_key, likelihoods_outputs, get_perword_likelihood)
     predictions = predict_NB(P_positive, P_negative)
 
-    #evaluate results for Naive Bayes
     y_test = np.load('Stored/DocsVocab/y_test.npy')
-    evaluate(predictions[0], y_test, "NB-NOSTEM-FREQ")
-    evaluate(predictions[1], y_test, "NB-NOSTEM-BINARY")
-    evaluate(predictions[2], y_test, "NB-NOSTEM-TFIDF")
-    evaluate(predictions[3], y_test, "NB-STEM-FREQ")
-    evaluate(predictions[4], y_test, "NB-STEM-BINARY")
-    evaluate(predictions[5], y_test, "NB-STEM-TFIDF")
     
-    #Logistic Regression
-    #nostem no l2
-    LR_model = Logistic_Regression_L2_SGD(n_iter=15,eta=1, batch_size=10000)
-    LR_model.fit(np.load('Stored/Vectors/trainbow_freq.npy'), np.load('Stored/DocsVocab/y_train.npy'))
-    save_obj('Stored/Models/LR-bowfreq-noL2',LR_model)
-    predictions = LR_model.predict(np.load('Stored/Vectors/testbow_freq.npy'))
-    evaluate(predictions, y_test, "LOGISTIC_FREQ_NOL2")
-    LR_model = Logistic_Regression_L2_SGD(n_iter=15,eta=1, batch_size=10000)
-    LR_model.fit(np.load('Stored/Vectors/trainbow_binary.npy'), np.load('Stored/DocsVocab/y_train.npy'))
-    save_obj('Stored/Models/LR-bowbinary-noL2',LR_model)
-    predictions = LR_model.predict(np.load('Stored/Vectors/testbow_binary.npy'))
-    evaluate(predictions, y_test, "LOGISTIC_BINARY_NOL2")
-    LR_model = Logistic_Regression_L2_SGD(n_iter=15,eta=1, batch_size=10000)
-    LR_model.fit(np.load('Stored/Vectors/train_tfidf.npy'), np.load('Stored/DocsVocab/y_train.npy'))
-    save_obj('Stored/Models/LR-tfidf-noL2',LR_model)
-    predictions = LR_model.predict(np.load('Stored/Vectors/test_tfidf.npy'))
-    evaluate(predictions, y_test, "LOGISTIC_TFIDF_NOL2")
-
-    #stem no l2
-    LR_model = Logistic_Regression_L2_SGD(n_iter=15,eta=1, batch_size=10000)
-    LR_model.fit(np.load('Stored/Vectors/trainbow_stem_freq.npy'), np.load('Stored/DocsVocab/y_train.npy'))
-    save_obj('Stored/Models/LR-bowfreq-stem-noL2',LR_model)
-    predictions = LR_model.predict(np.load('Stored/Vectors/testbow_stem_freq.npy'))
-    evaluate(predictions, y_test, "LOGISTIC_FREQ_STEM_NOL2")
-    LR_model = Logistic_Regression_L2_SGD(n_iter=15,eta=1, batch_size=10000)
-    LR_model.fit(np.load('Stored/Vectors/trainbow_stem_binary.npy'), np.load('Stored/DocsVocab/y_train.npy'))
-    save_obj('Stored/Models/LR-bowbinary-stem-noL2',LR_model)
-    predictions = LR_model.predict(np.load('Stored/Vectors/testbow_stem_binary.npy'))
-    evaluate(predictions, y_test, "LOGISTIC_BINARY_STEM_NOL2")
-    LR_model = Logistic_Regression_L2_SGD(n_iter=15,eta=1, batch_size=10000)
-    LR_model.fit(np.load('Stored/Vectors/train_tfidf_stem.npy'), np.load('Stored/DocsVocab/y_train.npy'))
-    save_obj('Stored/Models/LR-tfidf-stem-noL2',LR_model)
-    predictions = LR_model.predict(np.load('Stored/Vectors/test_tfidf_stem.npy'))
-    evaluate(predictions, y_test, "LOGISTIC_TFIDF_STEM_NOL2")
-
-    #l2
-    LR_model = Logistic_Regression_L2_SGD(n_iter=15,eta=0.1,l2=5, batch_size=10000)
-    LR_model.fit(np.load('Stored/Vectors/trainbow_freq.npy'), np.load('Stored/DocsVocab/y_train.npy'))
-    save_obj('Stored/Models/LR-bowfreq-L2',LR_model)
-    predictions = LR_model.predict(np.load('Stored/Vectors/testbow_freq.npy'))
-    evaluate(predictions, y_test, "LOGISTIC_FREQ_L2")
-    LR_model = Logistic_Regression_L2_SGD(n_iter=15,eta=0.1,l2=5, batch_size=10000)
-    LR_model.fit(np.load('Stored/Vectors/trainbow_binary.npy'), np.load('Stored/DocsVocab/y_train.npy'))
-    save_obj('Stored/Models/LR-bowbinary-L2',LR_model)
-    predictions = LR_model.predict(np.load('Stored/Vectors/testbow_binary.npy'))
-    evaluate(predictions, y_test, "LOGISTIC_BINARY_L2")
-    LR_model = Logistic_Regression_L2_SGD(n_iter=15,eta=0.1,l2=5, batch_size=10000)
-    LR_model.fit(np.load('Stored/Vectors/train_tfidf.npy'), np.load('Stored/DocsVocab/y_train.npy'))
-    save_obj('Stored/Models/LR-tfidf-L2',LR_model)
-    predictions = LR_model.predict(np.load('Stored/Vectors/test_tfidf.npy'))
-    evaluate(predictions, y_test, "LOGISTIC_TFIDF_L2")
-
-    #stem l2
-    LR_model = Logistic_Regression_L2_SGD(n_iter=15,eta=0.1,l2=5, batch_size=10000)
-    LR_model.fit(np.load('Stored/Vectors/trainbow_stem_freq.npy'), np.load('Stored/DocsVocab/y_train.npy'))
-    save_obj('Stored/Models/LR-bowfreq-stem-L2',LR_model)
-    predictions = LR_model.predict(np.load('Stored/Vectors/trainbow_stem_freq.npy'))
-    evaluate(predictions, y_test, "LOGISTIC_FREQ_STEM_L2")
-    LR_model = Logistic_Regression_L2_SGD(n_iter=15,eta=0.1,l2=5, batch_size=10000)
-    LR_model.fit(np.load('Stored/Vectors/trainbow_stem_binary.npy'), np.load('Stored/DocsVocab/y_train.npy'))
-    save_obj('Stored/Models/LR-bowbinary-stem-L2',LR_model)
-    predictions = LR_model.predict(np.load('Stored/Vectors/trainbow_stem_binary.npy'))
-    evaluate(predictions, y_test, "LOGISTIC_BINARY_STEM_L2")
-    LR_model = Logistic_Regression_L2_SGD(n_iter=15,eta=0.1,l2=5, batch_size=10000)
-    LR_model.fit(np.load('Stored/Vectors/train_tfidf_stem.npy'), np.load('Stored/DocsVocab/y_train.npy'))
-    save_obj('Stored/Models/LR-tfidf-stem-L2',LR_model)
-    predictions = LR_model.predict(np.load('Stored/Vectors/test_tfidf_stem.npy'))
-    evaluate(predictions, y_test, "LOGISTIC_TFIDF_STEM_L2")
-
-def get_trainandtest_vocabanddocs():
+    #Logistic Regression -- models are only fit again if their vectors, parameters or code changed
+    #the models that need to be fit are trained at the same time in a process pool (see train_LR_grid)
+    model_keys = {name: cache.get_key(vectors_key, train_vectors, params, Logistic_Regression_L2_SGD, LR_vectors_file, fit_LR_model)
+                  for name, model_file, train_vectors, params in LR_models}
+    stale_models = [model for model in LR_models if not cache.is_current(model[0], model_keys[model[0]])]
+    fit_times = train_LR_grid(stale_models, n_jobs)
+    for name, model_file, train_vectors, params in LR_models:
+        if name in fit_times:
+            cache.record(name, model_keys[name], ['Stored/Models/%s.pkl' % model_file])
+        LR_model = load_obj('Stored/Models/' + model_file)
+        predictions.append(LR_model.predict(load_sparse(LR_vectors_file(train_vectors.replace('train', 'test')))).ravel())
+
+    #evaluate every model at once
+    results = evaluate_all(np.vstack(predictions), y_test, NB_models + [model[0] for model in LR_models])
+    results['fit_seconds'] = [fit_times.get(name) for name in results.index]
+    results.to_csv('Stored/results.csv')
+
+def get_stage_keys():
+    '''
+    The cache keys of the Docs, Vectors and Likelihoods stages of main. Each key includes the key of the stage before it.
+    Only the source of the functions and classes is hashed, so the module settings they read (the emoticon pattern, the
+    hashing and TFIDF options) and the nltk version (word_tokenize and the Porter stemmer) are added to the keys.
+    '''
+    docs_key = StageCache.get_key(get_folder_fingerprint('Data'), emoticon_string, nltk.__version__, list_corpus, read_file, StemCache,
+                                  Tokenizer, tokenize_review, tokenize_file, list_reviews, tokenize_paths, TokenTable, PackedCorpus,
+                                  get_trainandtest_vocabanddocs)
+    vectors_key = StageCache.get_key(docs_key, save_sparse, count_matrix_from_corpus, binary_from_counts, TFIDF_Transformer, tfidf_options,
+                                     hash_word.__wrapped__, Hashing_Vectorizer, hashing_buckets, hashing_signed, save_vocab_dict,
+                                     save_signed_vectors, get_vectors)
+    likelihoods_key = StageCache.get_key(vectors_key, get_class_statistics, get_likelihoods, save_likelihoods, get_perword_likelihood)
+    return docs_key, vectors_key, likelihoods_key
+
+def get_vectors_outputs():
+    # files saved by get_vectors, the signed Logistic Regression vectors are only saved with hashing_signed
+    if hashing_buckets and hashing_signed:
+        return vectors_outputs + ['Stored/Vectors/signed_%s' % f for f in vector_names]
+    return vectors_outputs
+
+def LR_vectors_file(name):
+    # file of the vectors the Logistic Regression models are fit and scored on (the signed vectors with hashing_signed)
+    if hashing_buckets and hashing_signed:
+        return 'Stored/Vectors/signed_' + name
+    return 'Stored/Vectors/' + name
+
+def ingest_new_reviews(n_jobs=None):
+    '''
+    Adds the reviews in Data/train and Data/test that have not been ingested yet to the stored documents, vectors and
+    Naive Bayes likelihoods without rebuilding them from scratch. Only the new reviews are tokenized:
+        new training words are appended to the end of the vocabulary, so the existing column indices don't change
+        the count rows of the new training reviews are stacked under the stored count matrix
+        the Naive Bayes class statistics (nb_stats.npz) are updated with the new rows only and the likelihoods are
+        recomputed from them
+    The idf depends on the number of documents, so the TFIDF vectors are rescaled from the counts, and the test vectors
+    are rebuilt from the stored test documents since new words can now be counted in them.
+    The stage cache is updated, so main afterwards only refits the models.
+    '''
+    if not all(os.path.exists(f) for f in docs_outputs + get_vectors_outputs() + likelihoods_outputs):
+        print("Nothing To Ingest Into -- run main first")
+        return
+    ingested = load_obj('Stored/DocsVocab/ingested_files')
+    new_reviews = {}
+    for split in ['train', 'test']:
+        seen = set(ingested[split])
+        paths, labels = list_reviews('Data/' + split)
+        new_reviews[split] = [(path, label) for path, label in zip(paths, labels) if path not in seen]
+    print("Ingesting %s Train and %s Test Reviews --- %s minutes ---" % (len(new_reviews['train']), len(new_reviews['test']),
+                                                                      round((time.time() - start_time)/60,2)))
+
+    #tokenize only the new reviews and append them to the stored documents
+    new_docs = {}
+    for split, docs_name in [('train', 'trainingdocs'), ('test', 'testdocs')]:
+        paths = [path for path, label in new_reviews[split]]
+        docs, docs_stemmed = tokenize_paths(paths, n_jobs)
+        new_docs[split] = {'': docs, '_stem': docs_stemmed}
+        for stem_name, docs_list in new_docs[split].items():
+            stored = 'Stored/DocsVocab/%s%s' % (docs_name, stem_name.replace('_stem', '_stemmed'))
+            PackedCorpus.load(stored, mmap_mode=None).extend(docs_list).save(stored) #not memory-mapped since it is overwritten
+        labels_file = 'Stored/DocsVocab/y_%s.npy' % split
+        np.save(labels_file, np.concatenate([np.load(labels_file), np.array([label for path, label in new_reviews[split]], dtype=int)]))
+        ingested[split].extend(paths)
+    y_new = np.array([label for path, label in new_reviews['train']], dtype=int)
+
+    stats = dict(np.load('Stored/Likelihoods/nb_stats.npz'))
+    for stem_name, vocab_name, dict_name in [('', 'vocabulary', 'vocab_dict'), ('_stem', 'vocabulary_stemmed', 'stem_vocab_dict')]:
+        #new words get the next column indices
+        vocab_dict = load_vocab_dict('Stored/DocsVocab/' + dict_name)
+        new_words = []
+        if not isinstance(vocab_dict, Hashing_Vectorizer): #hashed vectors already have a column for every word
+            new_words = sorted(set(itertools.chain.from_iterable(new_docs['train'][stem_name])) - set(vocab_dict))
+            for word in new_words:
+                vocab_dict[word] = len(vocab_dict)
+            save_vocab_dict('Stored/DocsVocab/' + dict_name, vocab_dict)
+        TokenTable.load('Stored/DocsVocab/' + vocab_name, mmap_mode=None).extend(new_words).save('Stored/DocsVocab/' + vocab_name)
+
+        #the stored rows only need zero columns added for the new words
+        counts = load_sparse('Stored/Vectors/trainbow%s_freq' % stem_name, mmap_mode=None)
+        counts = sparse.csr_matrix((counts.data, counts.indices, counts.indptr), shape=(counts.shape[0], len(vocab_dict)))
+        new_counts = build_count_matrix(new_docs['train'][stem_name], vocab_dict)
+        counts = sparse.vstack([counts, new_counts], format='csr')
+
+        #update the class statistics with the new rows only
+        class_counts, class_df, class_docs = [np.pad(stats['%s%s' % (stat, stem_name)], [(0, 0), (0, len(new_words))])
+                                              if stat != 'class_docs' else stats['%s%s' % (stat, stem_name)]
+                                              for stat in ['class_counts', 'class_df', 'class_docs']]
+        new_class_counts, new_class_df, new_class_docs = get_class_statistics(new_counts, y_new)
+        stats['class_counts' + stem_name] = class_counts + new_class_counts
+        stats['class_df' + stem_name] = class_df + new_class_df
+        stats['class_docs' + stem_name] = class_docs + new_class_docs
+
+        #the document frequencies of the train idf are the class document frequencies summed over the classes
+        tfidf = TFIDF_Transformer(**tfidf_options).set_idf(stats['class_df' + stem_name].sum(axis=0), counts.shape[0])
+        np.save('Stored/Vectors/idf' + stem_name, tfidf.idf)
+        save_sparse('Stored/Vectors/trainbow%s_freq' % stem_name, counts)
+        save_sparse('Stored/Vectors/trainbow%s_binary' % stem_name, binary_from_counts(counts))
+        save_sparse('Stored/Vectors/train_tfidf' + stem_name, tfidf.transform(counts))
+
+        #the test vectors are counted again with the extended vocabulary
+        testdocs = PackedCorpus.load('Stored/DocsVocab/testdocs' + stem_name.replace('_stem', '_stemmed'))
+        test_counts = count_matrix_from_corpus(testdocs, vocab_dict)
+        save_sparse('Stored/Vectors/testbow%s_freq' % stem_name, test_counts)
+        save_sparse('Stored/Vectors/testbow%s_binary' % stem_name, binary_from_counts(test_counts))
+        save_sparse('Stored/Vectors/test_tfidf' + stem_name, tfidf.transform(test_counts))
+
+        #the signed Logistic Regression vectors get the signed rows of the new reviews and the new idf the same way
+        if getattr(vocab_dict, 'signed', False):
+            signed_counts = load_sparse('Stored/Vectors/signed_trainbow%s_freq' % stem_name, mmap_mode=None)
+            signed_counts = sparse.vstack([signed_counts, vocab_dict.transform(new_docs['train'][stem_name])], format='csr')
+            save_signed_vectors('train', stem_name, signed_counts, tfidf)
+            save_signed_vectors('test', stem_name, vocab_dict.transform_corpus(testdocs), tfidf)
+
+    np.savez('Stored/Likelihoods/nb_stats', **stats)
+    save_likelihoods(stats)
+    save_obj('Stored/DocsVocab/ingested_files', ingested)
+
+    #the stored results now match the reviews in Data
+    cache = StageCache()
+    for stage, key, outputs in zip(['Docs', 'Vectors', 'Likelihoods'], get_stage_keys(), [docs_outputs, get_vectors_outputs(), likelihoods_outputs]):
+        cache.record(stage, key, outputs)
+    print("New Reviews Ingested --- %s minutes ---" % (round((time.time() - start_time)/60,2)))
+
+def fit_LR_model(model):
+    '''
+    Fits and saves one of the LR_models. This runs in a worker process of train_LR_grid, so the matrices are
+    loaded memory-mapped -- every worker that uses the same vectors shares the same pages of the file.
+    Returns the name of the model and the number of seconds the fit took.
+    The model is pickled as HW1.Logistic_Regression_L2_SGD (main always runs from the HW1 module, see the end of the
+    file) so serve.py and anything else that imports HW1 can load it.
+    '''
+    name, model_file, train_vectors, params = model
+    fit_start = time.time()
+    LR_model = Logistic_Regression_L2_SGD(**params)
+    LR_model.fit(load_sparse(LR_vectors_file(train_vectors)), np.load('Stored/DocsVocab/y_train.npy', mmap_mode='r'))
+    save_obj('Stored/Models/' + model_file, LR_model)
+    return name, time.time() - fit_start
+
+def train_LR_grid(models, n_jobs=None):
+    '''
+    Fits every model in models (same format as LR_models) in a pool of n_jobs processes (None = number of cpus).
+    The models are independent, so the whole grid takes about as long as the slowest model.
+    Returns a dictionary with the fit time in seconds of each model.
+    '''
+    if not models:
+        return {}
+    print("Training %s Logistic Regression Models --- %s minutes ---" % (len(models), round((time.time() - start_time)/60,2)))
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        fit_times = dict(executor.map(fit_LR_model, models))
+    return fit_times
+
+class Tokenizer:
+    """ Tokenizer that tokenizes text. Can also stem words.
+    The regular expressions are compiled once when the tokenizer is created instead of on every call.
+
+    The steps are:
+        remove numbers and html tags (a single pass)
+        lowercase words that start with a capital letter but not all capital words
+        split on emoticon faces and word tokenize the text between them
+        stem the tokens if stem=True
+
+    The parameters are:
+        stemmer: stemmer used when stem=True
+    """
+    # numbers used to be removed before the html tags, so a tag has to contain something that isn't a number
+    # ("<1>" becomes "<>" and is kept). With that rule both can be removed in the same pass.
+    remove_regex = re.compile(r'<\d*[^>\d][^>]*>|\d+')
+    capital_regex = re.compile('([A-Z][a-z]+)')
+    emoticon_regex = re.compile(emoticon_string)
+
+    def __init__(self, stemmer=porter_stemmer):
+        self.stemmer = stemmer
+
+    def tokenize(self, txt, stem=False):
+        # from nltk.corpus import stopwords #this is not used as per the requirements, although it improves performance
+        # stopwords = set(stopwords.words('english')) 
+        # txt = txt.translate(str.maketrans('', '', string.punctuation)) #removes punctuation - not used as per requirements
+        txt = self.remove_regex.sub('', txt) #remove numbers and html tags
+        txt = self.capital_regex.sub(lambda match: match.group(1).lower(), txt) #lowercase words that start with captial
+        # split based on emoji faces first -- the emoticon pattern is a capturing group, so every odd
+        # element of the split is an emoticon and every even element is the text between emoticons
+        fragments = self.emoticon_regex.split(txt)
+        tokens = []
+        for n, fragment in enumerate(fragments):
+            if n % 2:
+                tokens.append(fragment)
+            elif fragment:
+                tokens.extend(word_tokenize(fragment))
+        # tokens = [w for w in tokensfinal if w not in stopwords] #not used as per requirements
+
+        if stem:
+            tokens = [self.stemmer.stem(item) for item in tokens]
+        return tokens
+
+    def tokenize_many(self, texts, stem=False):
+        # tokenizes every text in an iterable of texts, returns a list of token lists
+        return [self.tokenize(txt, stem) for txt in texts]
+
+tokenizer = Tokenizer()
+
+def tokenize(txt,stem=False):
+    """
+    Tokenizer that tokenizes text. Can also stem words.
+    """
+    return tokenizer.tokenize(txt, stem)
+
+def tokenize_review(text):
+    """
+    Tokenizes a single review. The review is only tokenized once -- the stemmed tokens are the
+    unstemmed tokens passed through the stemmer. Returns (tokens, stemmed tokens).
+    """
+    tokens = tokenizer.tokenize(text)
+    return tokens, [porter_stemmer.stem(token) for token in tokens]
+
+def tokenize_file(path):
+    # reads and tokenizes one review file, run by the tokenize_paths workers
+    return tokenize_review(read_file(path))
+
+def list_reviews(folder):
+    '''
+    The paths of all of the reviews in the class folders (neg and pos) of folder and their labels (1 for pos and 0 for neg).
+    '''
+    paths = []
+    labels = []
+    for path, label in zip(*list_corpus(folder)): #the class folders are listed by threads
+        if label: #skip any files outside of the class folders
+            paths.append(path)
+            labels.append(1 if label == 'pos' else 0)
+    return paths, labels
+
+def tokenize_paths(paths, n_jobs=None):
+    '''
+    Tokenizes the reviews in paths with a pool of processes.
+    The workers read the files themselves, so only the paths are sent to them (in chunks) and the text of a review is
+    only in memory while it is being tokenized. The results are returned in the same order as the files.
+    n_jobs is the number of processes, all of the cores are used if it is None.
+    Returns the unstemmed docs and the stemmed docs.
+    '''
+    n_jobs = n_jobs or os.cpu_count()
+    chunksize = max(1, len(paths)//(n_jobs*16)) #small enough chunks to keep all of the workers busy until the end
+    docs = []
+    docs_stemmed = []
+    with Pool(n_jobs) as pool:
+        for tokens, tokens_stemmed in pool.imap(tokenize_file, paths, chunksize):
+            docs.append(tokens)
+            docs_stemmed.append(tokens_stemmed)
+    return docs, docs_stemmed
+
+def get_trainandtest_vocabanddocs(n_jobs=None):
 
     '''
     Create your Vocabulary: Read the complete training data word by word and create the
@@ -159,86 +501,176 @@ def get_trainandtest_vocabanddocs():
     HTML tags are removed. Punctuation and stop words are kept as per the instructions. A Porter stemmer is used where needed.
     Words which begin with a capitalized letter are lowercased. 
 
+    The reviews are tokenized in parallel by tokenize_paths using n_jobs processes. The reviews that were read are
+    saved so that ingest_new_reviews can add new reviews later.
     '''
 
-    def tokenize(txt,stem=False, model=NB):
-        """
-        Tokenizer that tokenizes text. Can also stem words.
-        """
-        # from nltk.corpus import stopwords #this is not used as per the requirements, although it improves performance
-        # stopwords = set(stopwords.words('english')) 
-        # txt = txt.translate(str.maketrans('', '', string.punctuation)) #removes punctuation - not used as per requirements
-        txt = re.sub(r'\d+', '', txt) #remove numbers
-        def lower_repl(match):
-            return match.group(1).lower()
-
-        # txt = r"This is a practice tweet :). Let's hope our-system can get it right. \U0001F923 something."
-        txt = re.sub('(?:<[^>]+>)', '', txt)# remove html tags
-        txt = re.sub('([A-Z][a-z]+)',lower_repl,txt) #lowercase words that start with captial
-        tokens = re.split(emoticon_string,txt) #split based on emoji faces first 
-        tokensfinal = []
-        for i in tokens:
-            if not re.match(emoticon_string,i):
-                to_add = word_tokenize(i)
-                tokensfinal = tokensfinal + to_add
-            else:
-                tokensfinal.append(i)
-
-        tokens= tokensfinal
-        # tokens = [w for w in tokensfinal if w not in stopwords] #not used as per requirements
-
-        if stem:
-            stemmer = PorterStemmer()
-            stemmed = [stemmer.stem(item) for item in tokens]
-            tokens = stemmed
-        return tokens
-
-    #initalize train variables
-    trainingdocs = []
-    trainingdocs_stemmed = []
-    vocabulary = []
-    vocabulary_stemmed = []
-    y_train = []
-
     #create megadocument of all training tweets stemmed and not stemmed
-    for folder in os.listdir('Data/train'):
-        for f in os.listdir(os.path.join('Data/train',folder)):
-            tweet = open(os.path.join('Data/train',folder,f),encoding="utf8").read()
-            y_train.append(folder)
-            trainingdocs.append(tokenize(tweet,False)) #don't stem
-            trainingdocs_stemmed.append(tokenize(tweet,True))# stem
-
-    #raw python to get unique vocabulary words from the mega training documents
-    vocabulary = list(set(list(itertools.chain.from_iterable(trainingdocs))))
-    vocabulary_stemmed = list(set(list(itertools.chain.from_iterable(trainingdocs_stemmed))))
-    y_train = np.array(list(map(lambda x: 1 if x == 'pos' else 0, y_train))) #add labels 
+    train_paths, y_train = list_reviews('Data/train')
+    trainingdocs, trainingdocs_stemmed = tokenize_paths(train_paths, n_jobs)
+    y_train = np.array(y_train)
+
+    #the documents are stored as token ids (see PackedCorpus) -- the token table of the training documents is
+    #every unique word in them, so it is the vocabulary
+    trainingdocs = PackedCorpus.from_docs(trainingdocs)
+    trainingdocs_stemmed = PackedCorpus.from_docs(trainingdocs_stemmed)
+    vocabulary = trainingdocs.table
+    vocabulary_stemmed = trainingdocs_stemmed.table
     #save results
-    np.save('Stored/DocsVocab/trainingdocs',trainingdocs)
-    np.save('Stored/DocsVocab/trainingdocs_stemmed',trainingdocs_stemmed)
-    np.save('Stored/DocsVocab/vocabulary',vocabulary)
-    np.save('Stored/DocsVocab/vocabulary_stemmed',vocabulary_stemmed)
+    trainingdocs.save('Stored/DocsVocab/trainingdocs')
+    trainingdocs_stemmed.save('Stored/DocsVocab/trainingdocs_stemmed')
+    vocabulary.save('Stored/DocsVocab/vocabulary')
+    vocabulary_stemmed.save('Stored/DocsVocab/vocabulary_stemmed')
     np.save('Stored/DocsVocab/y_train',y_train)
     print("Train Docs Prepared --- %s seconds ---" % (round((time.time() - start_time)/60,2)))
 
-    #initalize test variables
-    testdocs = []
-    testdocs_stemmed = []
-    y_test = []
     #create megadocument of all testing tweets stemmed and not stemmed
-    for folder in os.listdir('Data/test'):
-        for f in os.listdir(os.path.join('Data/test',folder)):
-            tweet = open(os.path.join('Data/test',folder,f),encoding="utf8").read()
-            y_test.append(folder)
-            testdocs.append(tokenize(tweet,False)) #don't stem
-            testdocs_stemmed.append(tokenize(tweet,True))# stem
-    y_test = np.array(list(map(lambda x: 1 if x == 'pos' else 0, y_test))) #add labels
+    test_paths, y_test = list_reviews('Data/test')
+    testdocs, testdocs_stemmed = tokenize_paths(test_paths, n_jobs)
+    y_test = np.array(y_test)
     #save results
-    np.save('Stored/DocsVocab/testdocs',testdocs)
-    np.save('Stored/DocsVocab/testdocs_stemmed',testdocs_stemmed)
+    PackedCorpus.from_docs(testdocs).save('Stored/DocsVocab/testdocs')
+    PackedCorpus.from_docs(testdocs_stemmed).save('Stored/DocsVocab/testdocs_stemmed')
     np.save('Stored/DocsVocab/y_test',y_test)
+    save_obj('Stored/DocsVocab/ingested_files', {'train': train_paths, 'test': test_paths})
     print("Test Docs Prepared --- %s minutes ---" % (round((time.time() - start_time)/60,2)))
     return # print('vocabulary, vocabulary_stemmed, trainingdocs, trainingdocs_stemmed, y_train, testdocs, testdocs_stemmed, y_test')
 
+def build_count_matrix(docs, vocab_dict):
+    '''
+    Creates a sparse CSR bag of words frequency matrix for a list of tokenized documents. Each row is a document and each
+    column is the index of the word in vocab_dict. Words that are not in the vocabulary are skipped.
+    Only the nonzero counts are stored so memory grows with the number of tokens instead of documents * vocabulary.
+    '''
+    indptr = [0]
+    indices = []
+    for doc in docs:
+        indices.extend(vocab_dict[word] for word in doc if word in vocab_dict) #column index of each word in the doc
+        indptr.append(len(indices))
+    data = np.ones(len(indices), dtype=np.int32)
+    counts = sparse.csr_matrix((data, np.array(indices, dtype=np.int32), np.array(indptr, dtype=np.int64)),
+                                shape=(len(docs), len(vocab_dict)))
+    counts.sum_duplicates() #repeated words in a doc are summed into a single count
+    return counts
+
+@lru_cache(maxsize=2**18)
+def hash_word(word):
+    # crc32 of a word, cached since the same words are hashed over and over
+    return zlib.crc32(word.encode('utf8'))
+
+class Hashing_Vectorizer:
+    """ Feature hashing -- each word is mapped to one of n_buckets columns by the crc32 of the word instead of
+        by a vocabulary, so the width of the vectors is fixed no matter how many different words there are and no
+        vocabulary dictionary has to be built or stored. Different words can share a column.
+        It can be used in place of a vocabulary dictionary (every word is "in" it and vectorizer[word] is its column),
+        so build_count_matrix and count_matrix_from_corpus work with it the same way and give the unsigned counts.
+
+    The parameters are:
+        n_buckets: number of columns of the vectors
+        signed: each word adds +1 or -1 (from the top bit of its hash) in transform so words that share a column
+                cancel out on average instead of adding up. The counts are no longer counts, so this is only for
+                Logistic Regression -- Naive Bayes needs the unsigned counts.
+    """
+
+    def __init__(self, n_buckets=2**20, signed=False):
+        self.n_buckets = n_buckets
+        self.signed = signed
+
+    def __contains__(self, word):
+        return True
+
+    def __getitem__(self, word):
+        return hash_word(word) % self.n_buckets
+
+    def __len__(self):
+        return self.n_buckets
+
+    def transform(self, docs):
+        # sparse CSR matrix (documents x n_buckets) of the hashed counts of each document
+        if not self.signed:
+            return build_count_matrix(docs, self)
+        indptr = [0]
+        hashes = []
+        for doc in docs:
+            hashes.extend(hash_word(word) for word in doc)
+            indptr.append(len(hashes))
+        return self.signed_counts(np.array(hashes, dtype=np.uint32), np.array(indptr, dtype=np.int64))
+
+    def transform_corpus(self, corpus):
+        # same as transform for a PackedCorpus, each token id is hashed once through the token table
+        if not self.signed:
+            return count_matrix_from_corpus(corpus, self)
+        table_hashes = np.array([hash_word(token) for token in corpus.table.tolist()], dtype=np.uint32)
+        return self.signed_counts(table_hashes[corpus.tokens], np.asarray(corpus.offsets, dtype=np.int64))
+
+    def signed_counts(self, hashes, indptr):
+        # signed count matrix from the hash of every token and the offset of each document in them
+        data = np.where(hashes >> 31, -1, 1).astype(np.int32)
+        counts = sparse.csr_matrix((data, (hashes % self.n_buckets).astype(np.int32), indptr),
+                                   shape=(len(indptr) - 1, self.n_buckets))
+        counts.sum_duplicates()
+        counts.eliminate_zeros() #words that cancelled out
+        return counts
+
+def count_matrix_from_corpus(corpus, vocab_dict):
+    '''
+    Same as build_count_matrix for a PackedCorpus. Each token id is looked up in vocab_dict once through the token table
+    instead of looking up every word of every document, and the columns of all of the tokens are gathered in one step.
+    '''
+    columns = corpus.column_lookup(vocab_dict)[corpus.tokens]
+    in_vocab = columns >= 0 #words that are not in the vocabulary are skipped
+    counts = sparse.csr_matrix((np.ones(in_vocab.sum(), dtype=np.int32), (corpus.doc_ids()[in_vocab], columns[in_vocab])),
+                               shape=(len(corpus), len(vocab_dict)))
+    counts.sum_duplicates() #repeated words in a doc are summed into a single count
+    return counts
+
+def binary_from_counts(counts):
+    '''
+    Binary bag of words view of a count matrix. Shares the index arrays of the count matrix, only the data is new.
+    The data is the sign of each count, so it is all ones for counts and -1 or 1 for signed hashed counts.
+    '''
+    return sparse.csr_matrix((np.sign(counts.data).astype(np.int8), counts.indices, counts.indptr), shape=counts.shape)
+
+class TFIDF_Transformer:
+    """ Converts count matrices to TFIDF. The idf is fit once on the training counts and the same idf is used for the
+        test counts. idf = log(total documents / number of documents for each word), kept as float32.
+        Transforming only rescales the nonzero values, so the TFIDF matrix shares the index arrays of the count matrix.
+
+    The parameters are:
+        sublinear_tf: use 1 + log(count) as the term frequency instead of the count (keeping the sign of signed counts)
+        norm: 'l2' scales each document vector to unit length, None keeps the TFIDF values as they are
+    """
+
+    def __init__(self, sublinear_tf=False, norm=None):
+        self.sublinear_tf = sublinear_tf
+        self.norm = norm
+
+    def fit(self, counts):
+        # the number of documents for each word is the number of times its column index appears in the count matrix
+        return self.set_idf(np.bincount(counts.indices, minlength=counts.shape[1]), counts.shape[0])
+
+    def set_idf(self, df, n_docs):
+        # idf from the number of documents for each word (df) and the total number of documents
+        self.idf = np.log(np.float32(n_docs) / np.maximum(df, 1).astype(np.float32))
+        return self
+
+    def transform(self, counts):
+        data = counts.data.astype(np.float32)
+        if self.sublinear_tf:
+            data = np.sign(data) * (1 + np.log(np.abs(data)))
+        data *= self.idf[counts.indices] #multiply Tf * idf for tfidf -- scales every column in one pass
+        if self.norm == 'l2':
+            # the sum of squares of each row is the difference of the running sum at the start and end of the row
+            # rows without any words are left as zeros
+            running_sum = np.concatenate([[0], np.cumsum(data**2, dtype=np.float64)])
+            row_norms = np.sqrt(running_sum[counts.indptr[1:]] - running_sum[counts.indptr[:-1]]).astype(np.float32)
+            row_norms[row_norms == 0] = 1
+            data /= np.repeat(row_norms, np.diff(counts.indptr))
+        return sparse.csr_matrix((data, counts.indices, counts.indptr), shape=counts.shape)
+
+    def fit_transform(self, counts):
+        return self.fit(counts).transform(counts)
+
 def get_vectors(): 
     '''
     Extract Features: Convert documents to vectors using Bag of Words (BoW) representation. Do
@@ -248,158 +680,84 @@ def get_vectors():
 
     This function creates a BOW vector for all tokenized training and testing documents - both stemmed and unstemmed
     This function also creates a TFIDF vector for all tokenized training and testing documents
+    The vectors are sparse CSR matrices. The frequency count matrix is built once for each set of documents and the
+    binary and TFIDF vectors are derived from it.
+    If hashing_buckets is set the columns are hash buckets (see Hashing_Vectorizer) instead of vocabulary words and the
+    settings of the vectorizer are saved in place of the vocabulary dictionaries (see save_vocab_dict). If hashing_signed
+    is also set the Logistic Regression vectors are saved a second time with signed hashing (see save_signed_vectors).
     '''
-    trainingdocs = np.load('Stored/DocsVocab/trainingdocs.npy')
-    trainingdocs_stemmed = np.load('Stored/DocsVocab/trainingdocs_stemmed.npy')
-    vocabulary = np.load('Stored/DocsVocab/vocabulary.npy')
-    vocabulary_stemmed = np.load('Stored/DocsVocab/vocabulary_stemmed.npy')
-    testdocs = np.load('Stored/DocsVocab/testdocs.npy')
-    testdocs_stemmed = np.load('Stored/DocsVocab/testdocs_stemmed.npy')
+    trainingdocs = PackedCorpus.load('Stored/DocsVocab/trainingdocs')
+    trainingdocs_stemmed = PackedCorpus.load('Stored/DocsVocab/trainingdocs_stemmed')
+    testdocs = PackedCorpus.load('Stored/DocsVocab/testdocs')
+    testdocs_stemmed = PackedCorpus.load('Stored/DocsVocab/testdocs_stemmed')
+
+    if hashing_buckets:
+        # the counts are used by Naive Bayes too, so they are always unsigned -- with hashing_signed the Logistic
+        # Regression vectors are made separately by the transform of the vectorizer
+        vocab_dict = stem_vocab_dict = Hashing_Vectorizer(hashing_buckets, hashing_signed)
+    else:
+        vocabulary = TokenTable.load('Stored/DocsVocab/vocabulary')
+        vocabulary_stemmed = TokenTable.load('Stored/DocsVocab/vocabulary_stemmed')
+
+        # creating a dictionary where the key is the distinct vocab word and the
+        # value is the index that will be used in the matrix - for speed
+        vocab_dict = defaultdict(int)
+        for k, v in enumerate(vocabulary):
+            vocab_dict[v] = k
+            
+        stem_vocab_dict = defaultdict(int)
+        for k, v in enumerate(vocabulary_stemmed):
+            stem_vocab_dict[v] = k
+    #save dictionaries for word position information
+    save_vocab_dict('Stored/DocsVocab/vocab_dict',vocab_dict)
+    save_vocab_dict('Stored/DocsVocab/stem_vocab_dict',stem_vocab_dict)
 
     ##### Bag of Words Frequency Count #####
-    #initialize dimensions of final vectors
-    ncol = len(vocabulary)
-    nrow = len(trainingdocs)
-    ncol_stem = len(vocabulary_stemmed)
-    nrow_stem = len(trainingdocs_stemmed)
-
-    # creating a dictionary where the key is the distinct vocab word and the
-    # value is the index that will be used in the matrix - for speed
-    vocab_dict = defaultdict(int)
-    for k, v in enumerate(vocabulary):
-        vocab_dict[v] = k
-        
-    stem_vocab_dict = defaultdict(int)
-    for k, v in enumerate(vocabulary_stemmed):
-        stem_vocab_dict[v] = k
-    #save dictionaries for word position information
-    save_obj('Stored/DocsVocab/vocab_dict',vocab_dict)
-    save_obj('Stored/DocsVocab/stem_vocab_dict',stem_vocab_dict)
-
-    # mapping the word counts to the matrix
-    #train freq       
-    trainbow_freq = np.zeros((nrow,ncol), dtype=np.int8)
-    for n, doc in enumerate(trainingdocs): 
-        for word in doc:
-            if word in vocab_dict:
-                trainbow_freq[n, vocab_dict[word]] += 1 #add 1 if the word appears in tweet
-    np.save('Stored/Vectors/trainbow_freq',trainbow_freq) #save
-    del trainbow_freq #free memory
-
-    #train freq stemmed
-    trainbow_stem_freq = np.zeros((nrow_stem,ncol_stem), dtype=np.int8)
-    for n, doc in enumerate(trainingdocs_stemmed): 
-        for word in doc:
-            if word in stem_vocab_dict:
-                trainbow_stem_freq[n, stem_vocab_dict[word]] += 1 #add 1 if the word appears in tweet
-    np.save('Stored/Vectors/trainbow_stem_freq',trainbow_stem_freq)
-    del trainbow_stem_freq #free memory
-
-    #test freq
-    testbow_freq = np.zeros((nrow,ncol), dtype=np.int8)
-    for n, doc in enumerate(testdocs): 
-        for word in doc:
-            if word in vocab_dict:
-                testbow_freq[n, vocab_dict[word]] += 1 #add 1 if the word appears in tweet
-    np.save('Stored/Vectors/testbow_freq',testbow_freq)
-    del testbow_freq #free memory
-
-
-    #test freq stemmed
-    testbow_stem_freq = np.zeros((nrow_stem,ncol_stem), dtype=np.int8)
-    for n, doc in enumerate(testdocs_stemmed): 
-        for word in doc:
-            if word in stem_vocab_dict:
-                testbow_stem_freq[n, stem_vocab_dict[word]] += 1 #add 1 if the word appears in tweet
-    np.save('Stored/Vectors/testbow_stem_freq',testbow_stem_freq)
-    del testbow_stem_freq #free memory
+    trainbow_freq = count_matrix_from_corpus(trainingdocs, vocab_dict)
+    trainbow_stem_freq = count_matrix_from_corpus(trainingdocs_stemmed, stem_vocab_dict)
+    testbow_freq = count_matrix_from_corpus(testdocs, vocab_dict)
+    testbow_stem_freq = count_matrix_from_corpus(testdocs_stemmed, stem_vocab_dict)
+    save_sparse('Stored/Vectors/trainbow_freq', trainbow_freq) #save
+    save_sparse('Stored/Vectors/trainbow_stem_freq', trainbow_stem_freq)
+    save_sparse('Stored/Vectors/testbow_freq', testbow_freq)
+    save_sparse('Stored/Vectors/testbow_stem_freq', testbow_stem_freq)
 
     ##### Bag of Words Binary Count #####
-    # mapping the word counts to the matrix
-    #train binary 
-    trainbow_binary = np.zeros((nrow,ncol), dtype=np.int8)
-    for n, doc in enumerate(trainingdocs): 
-        for word in doc:
-            if word in vocab_dict:
-                trainbow_binary[n, vocab_dict[word]] = 1 #set to 1 if the word appears in tweet
-    np.save('Stored/Vectors/trainbow_binary',trainbow_binary)
-    del trainbow_binary 
-
-    #train binary stemmed
-    trainbow_stem_binary = np.zeros((nrow_stem,ncol_stem), dtype=np.int8)                       
-    for n, doc in enumerate(trainingdocs_stemmed): 
-        for word in doc:
-            if word in stem_vocab_dict:
-                trainbow_stem_binary[n, stem_vocab_dict[word]] = 1 #set to 1 if the word appears in tweet
-    np.save('Stored/Vectors/trainbow_stem_binary',trainbow_stem_binary)
-    del trainbow_stem_binary 
-
-    #test binary 
-    testbow_binary = np.zeros((nrow,ncol), dtype=np.int8)
-    for n, doc in enumerate(testdocs): 
-        for word in doc:
-            if word in vocab_dict:
-                testbow_binary[n, vocab_dict[word]] = 1 #set to 1 if the word appears in tweet
-    np.save('Stored/Vectors/testbow_binary',testbow_binary)
-    del testbow_binary  
-
-    #test binary stemmed
-    testbow_stem_binary = np.zeros((nrow_stem,ncol_stem), dtype=np.int8)                        
-    for n, doc in enumerate(testdocs_stemmed): 
-        for word in doc:
-            if word in stem_vocab_dict:
-                testbow_stem_binary[n, stem_vocab_dict[word]] = 1 #set to 1 if the word appears in tweet
-    np.save('Stored/Vectors/testbow_stem_binary',testbow_stem_binary)
-    del testbow_stem_binary 
+    save_sparse('Stored/Vectors/trainbow_binary', binary_from_counts(trainbow_freq))
+    save_sparse('Stored/Vectors/trainbow_stem_binary', binary_from_counts(trainbow_stem_freq))
+    save_sparse('Stored/Vectors/testbow_binary', binary_from_counts(testbow_freq))
+    save_sparse('Stored/Vectors/testbow_stem_binary', binary_from_counts(testbow_stem_freq))
 
     ## TFIDF ##
-    # get train idf
-    trainbow_freq = np.load('Stored/Vectors/trainbow_freq.npy') #use frequency count for TF
-    vector = np.int32(np.count_nonzero(trainbow_freq, axis = 0)) #count number of documents for each word
-    idf = np.int16(np.log(len(trainbow_freq)//vector)) # idf = log(total documents / numer of documents for each word)
-    del vector #free memory
-    train_tfidf = np.int8(np.multiply(trainbow_freq, idf)) #multiply Tf * idf for tfidf
-    del idf
-    np.save('Stored/Vectors/train_tfidf',train_tfidf) #save
-    del train_tfidf
-    trainbow_stem_freq = np.load('Stored/Vectors/trainbow_stem_freq.npy') #repeat for stem
-    vector = np.int32(np.count_nonzero(trainbow_stem_freq, axis = 0))
-    idf_stem = np.int16(np.log(np.true_divide(len(trainbow_stem_freq),vector)))
-    del vector
-    train_tfidf_stem = np.int8(np.multiply(trainbow_stem_freq,idf_stem))
-    del idf_stem
-    np.save('Stored/Vectors/train_tfidf_stem',train_tfidf_stem)
-    del train_tfidf_stem
-    del trainbow_freq
-    del trainbow_stem_freq
-
-    # get test idf
-    testbow_freq = np.load('Stored/Vectors/testbow_freq.npy')
-    vector = np.int32(np.count_nonzero(testbow_freq, axis = 0))
-    idf = np.int16(np.log(len(testbow_freq)//vector))
-    del vector
-    test_tfidf = np.int8(np.multiply(testbow_freq, idf))
-    del idf
-    np.save('Stored/Vectors/test_tfidf',test_tfidf)
-    del test_tfidf
-    testbow_stem_freq = np.load('Stored/Vectors/testbow_stem_freq.npy') #repeat for stem
-    vector = np.int32(np.count_nonzero(testbow_stem_freq, axis = 0))
-    idf_stem = np.int16(np.log(np.true_divide(len(testbow_stem_freq),vector)))
-    del vector
-    test_tfidf_stem = np.int8(np.multiply(testbow_stem_freq,idf_stem))
-    del idf_stem
-    np.save('Stored/Vectors/test_tfidf_stem',test_tfidf_stem)
-    del test_tfidf_stem
-    del testbow_freq
-    del testbow_stem_freq
-
-    #output vectors
-    # train_vecs = [trainbow_freq, trainbow_stem_freq, trainbow_binary, trainbow_stem_binary, train_tfidf, train_tfidf_stem]
-    # test_vecs = [testbow_freq, testbow_stem_freq, testbow_binary, testbow_stem_binary, test_tfidf, test_tfidf_stem]
+    # the idf is fit on the training counts only and used for both train and test
+    tfidf = TFIDF_Transformer(**tfidf_options).fit(trainbow_freq)
+    tfidf_stem = TFIDF_Transformer(**tfidf_options).fit(trainbow_stem_freq)
+    np.save('Stored/Vectors/idf', tfidf.idf) #train idf is also used for the Naive Bayes TFIDF likelihoods
+    np.save('Stored/Vectors/idf_stem', tfidf_stem.idf)
+    save_sparse('Stored/Vectors/train_tfidf', tfidf.transform(trainbow_freq))
+    save_sparse('Stored/Vectors/train_tfidf_stem', tfidf_stem.transform(trainbow_stem_freq))
+    save_sparse('Stored/Vectors/test_tfidf', tfidf.transform(testbow_freq))
+    save_sparse('Stored/Vectors/test_tfidf_stem', tfidf_stem.transform(testbow_stem_freq))
+
+    ## Signed Logistic Regression Vectors ##
+    # the idf is still the idf of the unsigned training counts
+    if hashing_buckets and hashing_signed:
+        for split, docs, docs_stemmed in [('train', trainingdocs, trainingdocs_stemmed), ('test', testdocs, testdocs_stemmed)]:
+            save_signed_vectors(split, '', vocab_dict.transform_corpus(docs), tfidf)
+            save_signed_vectors(split, '_stem', stem_vocab_dict.transform_corpus(docs_stemmed), tfidf_stem)
 
     print("Vectors Created --- %s minutes ---" % (round((time.time() - start_time)/60,2)))    
     return # print('train_vecs, vocab_dict, stem_vocab_dict, test_vecs') 
 
+def save_signed_vectors(split, stem_name, counts, tfidf):
+    '''
+    Saves the frequency, binary and TFIDF Logistic Regression vectors of the train or test documents from their signed
+    hashed counts. The names are the names of the unsigned vectors with signed_ in front (see LR_vectors_file).
+    '''
+    save_sparse('Stored/Vectors/signed_%sbow%s_freq' % (split, stem_name), counts)
+    save_sparse('Stored/Vectors/signed_%sbow%s_binary' % (split, stem_name), binary_from_counts(counts))
+    save_sparse('Stored/Vectors/signed_%s_tfidf%s' % (split, stem_name), tfidf.transform(counts))
+
 def get_class_priors():
     '''
     calculate the prior for each class = number of samples of class C in training set / total number of samples in training set (25000)
@@ -413,6 +771,34 @@ def get_class_priors():
     print("Priors Assessed --- %s minutes ---" % (round((time.time() - start_time)/60,2)))
     return P_positive,P_negative
 
+def get_class_statistics(counts, y):
+    '''
+    Naive Bayes sufficient statistics of a training count matrix. The class indicator matrix (2 x documents) is multiplied
+    with the count matrix so all of the per class sums are computed in one pass over the nonzero counts.
+    Row 0 of each array is the negative class and row 1 is the positive class.
+        class_counts - count(w,c) for each word
+        class_df - number of documents of class c that contain each word
+        class_docs - number of documents in each class
+    '''
+    class_indicator = sparse.csr_matrix((np.ones(y.size), (y, np.arange(y.size))), shape=(2, y.size))
+    class_counts = (class_indicator @ counts).toarray()
+    class_df = (class_indicator @ binary_from_counts(counts)).toarray()
+    class_docs = np.bincount(y, minlength=2)
+    return class_counts, class_df, class_docs
+
+def get_likelihoods(class_counts, class_df, class_docs, idf):
+    '''
+    Calculates P^(w|c) arrays for each class from the class statistics for each type of vector.
+    Returns a dictionary of (2 x |V|) arrays -- row 0 is the negative class and row 1 is the positive class.
+    The TFIDF of a word summed over a class is count(w,c) * idf(w), so the TFIDF matrix does not need to be read
+    (the options in tfidf_options only change the TFIDF vectors used by Logistic Regression).
+    '''
+    vocab_size = class_counts.shape[1]
+    class_tfidf = class_counts * idf
+    return {'frequency': (class_counts + 1) / (class_counts.sum(axis=1, keepdims=True) + vocab_size), #count(w, c)+1 /(count(c)+ |V|)
+            'binary': (class_df + 1) / (class_docs[:, None] + 2), #dfw,c+1 / dfc+2
+            'tfidf': (class_tfidf + 1) / (class_tfidf.sum(axis=1, keepdims=True) + vocab_size)} #Tf*idf(w,c) + 1 / (Tf*idf(W,c)+|V|)
+
 def get_perword_likelihood():
     '''
     Calculates P^(w|c) for each word for each class for each set of vectors
@@ -425,143 +811,50 @@ def get_perword_likelihood():
 
     TFIDF
     P^(w|c)=(Tf*idf(wi,cj)) + 1 / (Tf*idf(W,cj)+|V|)
+
+    The likelihoods are arrays aligned to the vocabulary index. All of them are computed from the class statistics
+    of the frequency count matrices and the twelve arrays are saved to a single .npz file.
+    The class statistics are saved to nb_stats.npz so ingest_new_reviews can update them with new reviews.
     '''
     #load needed data
-    trainbow_freq = np.load('Stored/Vectors/trainbow_freq.npy')
     y_train = np.load('Stored/DocsVocab/y_train.npy')
-    vocab_dict = load_obj('Stored/DocsVocab/vocab_dict')
-    stem_vocab_dict = load_obj('Stored/DocsVocab/stem_vocab_dict')
-
-    ## frequency Pˆ(w | c) = count(w, c)+1 /(count(c)+ |V|) 
-    #initialize output vars
-    frequencydict_pos = defaultdict()
-    frequencydict_neg = defaultdict()
-    frequencydict_pos_stem = defaultdict()
-    frequencydict_neg_stem = defaultdict()
-    num_pos = list(y_train).count(1) #count number of positive trainnig docs for indexing
-
-    ## frequency not stemmed ##  
-    denom_pos =trainbow_freq[(1+num_pos):,:].sum()+len(vocab_dict.keys()) #sum of all positive words and vocab size
-    denom_neg = trainbow_freq[:num_pos:,:].sum()+len(vocab_dict.keys()) #sum of all negative words and vocab size
-    trainbow_freq_pos_sum = trainbow_freq[(1+num_pos):,:].sum(axis = 0) #per word summing for positive class
-    trainbow_freq_neg_sum = trainbow_freq[:num_pos,:].sum(axis = 0) # per word summing for negative class
-    
-    for v in vocab_dict.keys():
-
-        frequencydict_pos[v] = (trainbow_freq_pos_sum[vocab_dict[v]]+1) /(denom_pos) #calculate probability of each word given class
-        frequencydict_neg[v] = (trainbow_freq_neg_sum[vocab_dict[v]]+1) /(denom_neg) #uses +1 smoothing
-
-    save_obj('Stored/Likelihoods/frequencydict_pos',frequencydict_pos) #save
-    save_obj('Stored/Likelihoods/frequencydict_neg',frequencydict_neg)
-    del frequencydict_pos #free memory
-    del frequencydict_neg
-    del trainbow_freq
-
-    ## frequency stemmed ## 
-    trainbow_stem_freq = np.load('Stored/Vectors/trainbow_stem_freq.npy') 
-    denom_stem_pos = trainbow_stem_freq[(1+num_pos):,:].sum()+len(stem_vocab_dict.keys()) #sum of all positive words and vocab size
-    denom_stem_neg = trainbow_stem_freq[:num_pos,:].sum()+len(stem_vocab_dict.keys()) #sum of all negative words and vocab size
-    trainbow_freq_stem_pos_sum = trainbow_stem_freq[(1+num_pos):,:].sum(axis = 0) #per word summing for positive class
-    trainbow_freq_stem_neg_sum = trainbow_stem_freq[:num_pos,:].sum(axis = 0) # per word summing for negative class
-
-    for v in stem_vocab_dict.keys():
-
-        frequencydict_pos_stem[v] = (trainbow_freq_stem_pos_sum[stem_vocab_dict[v]]+1) /(denom_stem_pos) #calculate probability of each word given class
-        frequencydict_neg_stem[v] = (trainbow_freq_stem_neg_sum[stem_vocab_dict[v]]+1) /(denom_stem_neg) #uses +1 smoothing
-    
-    save_obj('Stored/Likelihoods/frequencydict_pos_stem',frequencydict_pos_stem)
-    save_obj('Stored/Likelihoods/frequencydict_neg_stem',frequencydict_neg_stem)
-    del frequencydict_pos_stem
-    del frequencydict_neg_stem
-    del trainbow_stem_freq
-
-
-    # binary ##  Multi-variate Bernoulli Naive Bayes https://sebastianraschka.com/Articles/2014_naive_bayes_1.html
-    #initialize variables
-    trainbow_binary = np.load('Stored/Vectors/trainbow_binary.npy')
-    binarydict_pos = defaultdict()
-    binarydict_neg = defaultdict()
-    binarydict_pos_stem = defaultdict()
-    binarydict_neg_stem = defaultdict()
-
-    ## binary not stemmed ## 
-    trainbow_binary_pos_sum = trainbow_binary[(1+num_pos):,:].sum(axis = 0) #per word summing for positive class
-    trainbow_binary_neg_sum = trainbow_binary[:num_pos,:].sum(axis = 0) # per word summing for negative class
-    pos_docs = num_pos #number of positive documents
-    neg_docs = list(y_train).count(0) #number of negative documents
-    
-    for v in vocab_dict.keys():
-            
-        binarydict_pos[v] = (trainbow_binary_pos_sum[vocab_dict[v]]+1) /((pos_docs) + 2) #calculate per word probabilities based on
-        binarydict_neg[v] = (trainbow_binary_neg_sum[vocab_dict[v]]+1) /((neg_docs) + 2) #multivariate Bernoulli Naive Bayes with smoothing
-
-    save_obj('Stored/Likelihoods/binarydict_pos', binarydict_pos)
-    save_obj('Stored/Likelihoods/binarydict_neg', binarydict_neg)
-    del binarydict_pos
-    del binarydict_neg
-    del trainbow_binary
-
-    ## binary stemmed ##
-    trainbow_stem_binary = np.load('Stored/Vectors/trainbow_stem_binary.npy')
-    trainbow_binary_stem_pos_sum = trainbow_stem_binary[(1+num_pos):,:].sum(axis = 0) #per word summing for positive class
-    trainbow_binary_stem_neg_sum = trainbow_stem_binary[:num_pos,:].sum(axis = 0) # per word summing for negative class
-
-    for v in stem_vocab_dict.keys():
-            
-        binarydict_pos_stem[v] = (trainbow_binary_stem_pos_sum[stem_vocab_dict[v]]+1) /((pos_docs) + 2) #calculate per word probabilities based on
-        binarydict_neg_stem[v] = (trainbow_binary_stem_neg_sum[stem_vocab_dict[v]]+1) /((neg_docs) + 2) #multivariate Bernoulli Naive Bayes with smoothing
-
-    save_obj('Stored/Likelihoods/binarydict_pos_stem', binarydict_pos_stem)
-    save_obj('Stored/Likelihoods/binarydict_neg_stem', binarydict_neg_stem)
-    del binarydict_pos_stem
-    del binarydict_neg_stem
-    del trainbow_stem_binary
-
-
-    ## tfidf ##
-    #load and initalize
-    train_tfidf = np.load('Stored/Vectors/train_tfidf.npy')
-    tfidf_pos = defaultdict()
-    tfidf_neg = defaultdict()
-    tfidf_pos_stem = defaultdict()
-    tfidf_neg_stem = defaultdict()
-    #not stemmed
-    tfidf_pos_sum_word = train_tfidf[(1+num_pos):,:].sum(axis = 0) #per word summing for positive class
-    tfidf_neg_sum_word = train_tfidf[:num_pos,:].sum(axis = 0) # per word summing for negative class
-    tfidf_pos_denom = train_tfidf[(1+num_pos):,:].sum()+ len(vocab_dict.keys()) #summing all tfidf for positive class
-    tfidf_neg_denom = train_tfidf[:num_pos,:].sum()+ len(vocab_dict.keys()) #summing all tfidf for negative class
-
-    for v in vocab_dict.keys():
-        tfidf_pos[v] = (tfidf_pos_sum_word[vocab_dict[v]]+1) /(tfidf_pos_denom) # per word probabilities given class
-        tfidf_neg[v] = (tfidf_neg_sum_word[vocab_dict[v]]+1) /(tfidf_neg_denom) # (TFIDF for word in class + 1 )/ (TFIDF all words in class + |V|)
-    
-    save_obj('Stored/Likelihoods/tfidf_pos', tfidf_pos)
-    save_obj('Stored/Likelihoods/tfidf_neg', tfidf_neg)
-    del tfidf_pos
-    del tfidf_neg
-    del train_tfidf
-
-    #stemmed
-    train_tfidf_stem = np.load('Stored/Vectors/train_tfidf_stem.npy')
-    tfidf_stem_pos_sum_word = train_tfidf_stem[(1+num_pos):,:].sum(axis = 0) #per word summing for positive class
-    tfidf_stem_neg_sum_word = train_tfidf_stem[:num_pos,:].sum(axis = 0) # per word summing for negative class
-    tfidf_stem_pos_denom = train_tfidf_stem[(1+num_pos):,:].sum()+ len(stem_vocab_dict.keys()) #summing all tfidf for positive class
-    tfidf_stem_neg_denom = train_tfidf_stem[:num_pos,:].sum()+ len(stem_vocab_dict.keys()) #summing all tfidf for negative class
-
-    for v in stem_vocab_dict.keys():
-        tfidf_pos_stem[v] = (tfidf_stem_pos_sum_word[stem_vocab_dict[v]]+1) /(tfidf_stem_pos_denom)
-        tfidf_neg_stem[v] = (tfidf_stem_neg_sum_word[stem_vocab_dict[v]]+1) /(tfidf_stem_neg_denom)
-
-    save_obj('Stored/Likelihoods/tfidf_pos_stem', tfidf_pos_stem)
-    save_obj('Stored/Likelihoods/tfidf_neg_stem', tfidf_neg_stem)
-    del tfidf_pos_stem
-    del tfidf_neg_stem
-    del train_tfidf_stem
 
+    stats = {}
+    for stem_name in ['', '_stem']:
+        counts = load_sparse('Stored/Vectors/trainbow%s_freq' % stem_name)
+        for stat_name, stat in zip(['class_counts', 'class_df', 'class_docs'], get_class_statistics(counts, y_train)):
+            stats[stat_name + stem_name] = stat
+        del counts #free memory
 
+    np.savez('Stored/Likelihoods/nb_stats', **stats) #save
+    save_likelihoods(stats)
                             
     print("Word Likelihoods Calculated --- %s minutes ---" % (round((time.time() - start_time)/60,2)))
-    return print('wordlikelihood_dict')
+    return
+
+def save_likelihoods(stats):
+    '''
+    Calculates the likelihood arrays from the class statistics in stats (see get_perword_likelihood) and saves them.
+    '''
+    likelihoods = {}
+    for stem_name in ['', '_stem']:
+        idf = np.load('Stored/Vectors/idf%s.npy' % stem_name)
+        class_likelihoods = get_likelihoods(stats['class_counts' + stem_name], stats['class_df' + stem_name],
+                                            stats['class_docs' + stem_name], idf)
+        for vector_name, likelihood in class_likelihoods.items():
+            likelihoods['%s_neg%s' % (vector_name, stem_name)] = likelihood[0]
+            likelihoods['%s_pos%s' % (vector_name, stem_name)] = likelihood[1]
+
+    np.savez('Stored/Likelihoods/likelihoods', **likelihoods) #save
+
+def score_NB(X, loglikelihood_pos, loglikelihood_neg, P_positive, P_negative):
+    '''
+    Scores a whole set of documents with Naive Bayes at once. X is a sparse count matrix (documents x vocabulary).
+    log P(c|d) = log P(c) + sum of count(w,d) * log P(w|c) for each word in the document, so the difference between the
+    positive and negative class is a single sparse matrix-vector product with the difference of the log likelihoods.
+    Returns log P(pos|d) - log P(neg|d) for each document -- a document is positive when this is greater than 0.
+    '''
+    return X.dot(loglikelihood_pos - loglikelihood_neg) + (np.log(P_positive) - np.log(P_negative))
 
 def predict_NB(P_positive, P_negative):
     '''
@@ -570,113 +863,26 @@ def predict_NB(P_positive, P_negative):
     combinations of stemming + frequency count, stemming + binary, no-stemming + frequency
     count, no-stemming + binary.
     This is also done for TFIDF vectors - stemming and no-stemming
+
+    Every word occurrence in a test document adds its log likelihood to the class score, so the test frequency count
+    matrix is scored against the log likelihood arrays of each of the feature vectors.
     '''
     # log scale: http://www.cs.rhodes.edu/~kirlinp/courses/ai/f18/projects/proj3/naive-bayes-log-probs.pdf
     #load variables
-    frequencydict_pos = load_obj('Stored/Likelihoods/frequencydict_pos')
-    frequencydict_neg = load_obj('Stored/Likelihoods/frequencydict_neg')
-    frequencydict_pos_stem = load_obj('Stored/Likelihoods/frequencydict_pos_stem')
-    frequencydict_neg_stem = load_obj('Stored/Likelihoods/frequencydict_neg_stem')
-    binarydict_pos = load_obj('Stored/Likelihoods/binarydict_pos')
-    binarydict_neg = load_obj('Stored/Likelihoods/binarydict_neg')
-    binarydict_pos_stem = load_obj('Stored/Likelihoods/binarydict_pos_stem')
-    binarydict_neg_stem = load_obj('Stored/Likelihoods/binarydict_neg_stem')
-    tfidf_pos = load_obj('Stored/Likelihoods/tfidf_pos')
-    tfidf_neg = load_obj('Stored/Likelihoods/tfidf_neg')
-    tfidf_pos_stem = load_obj('Stored/Likelihoods/tfidf_pos_stem')
-    tfidf_neg_stem = load_obj('Stored/Likelihoods/tfidf_neg_stem')
-    testdocs = np.load('Stored/DocsVocab/testdocs.npy')
-    testdocs_stemmed = np.load('Stored/DocsVocab/testdocs_stemmed.npy')
-    y_test = np.load('Stored/DocsVocab/y_test.npy')
-    #put into workable form
-    wordlikelihood_dict = {"frequencydict_pos":frequencydict_pos, "frequencydict_neg":frequencydict_neg, \
-                                "frequencydict_pos_stem":frequencydict_pos_stem, "frequencydict_neg_stem":frequencydict_neg_stem, \
-                                "binarydict_pos":binarydict_pos, "binarydict_neg":binarydict_neg, \
-                                "binarydict_pos_stem":binarydict_pos_stem, "binarydict_neg_stem":binarydict_neg_stem, \
-                                "tfidf_pos":tfidf_pos,"tfidf_neg":tfidf_neg, \
-                                "tfidf_pos_stem":tfidf_pos_stem, "tfidf_neg_stem":tfidf_neg_stem}
-    # No-Stemming -- predict P(w |C) for each word in test documents take log and add to log of class priors - highest is chosen class
-    y_pred_freq = np.zeros(y_test.size)
-    y_pred_binary = np.zeros(y_test.size)
-    y_pred_tfidf = np.zeros(y_test.size)
-    for i, documt in enumerate(testdocs):
-        prob_pos_case1 = np.log(P_positive)
-        prob_pos_case2 = np.log(P_positive)
-        prob_pos_case3 = np.log(P_positive)
-        prob_neg_case1 = np.log(P_negative)
-        prob_neg_case2 = np.log(P_negative)
-        prob_neg_case3= np.log(P_negative)
-        for word in documt:
-            if word in wordlikelihood_dict["frequencydict_pos"].keys():
-                #pos
-                prob_pos_case1 += np.log(wordlikelihood_dict["frequencydict_pos"][word])
-                prob_pos_case2 += np.log(wordlikelihood_dict["binarydict_pos"][word])
-                prob_pos_case3 += np.log(wordlikelihood_dict["tfidf_pos"][word])
-                #neg
-                prob_neg_case1 += np.log(wordlikelihood_dict["frequencydict_neg"][word])
-                prob_neg_case2 += np.log(wordlikelihood_dict["binarydict_neg"][word])
-                prob_neg_case3 += np.log(wordlikelihood_dict["tfidf_neg"][word])
-            
-        # No-Stemming + Frequency count - assign class to test data
-        if prob_pos_case1 > prob_neg_case1:
-            y_pred_freq[i] = 1
-        else:
-            y_pred_freq[i] = 0
-            
-        # No-Stemming + Binary
-        if prob_pos_case2 > prob_neg_case2:
-            y_pred_binary[i] = 1
-        else:
-            y_pred_binary[i] = 0
-
-        # No-Stemming + TFIDF
-        if prob_pos_case3 > prob_neg_case3:
-            y_pred_tfidf[i] = 1
-        else:
-            y_pred_tfidf[i] = 0
-
-    # Stemming
-    y_pred_freq_stem = np.zeros(y_test.size)
-    y_pred_binary_stem = np.zeros(y_test.size)
-    y_pred_tfidf_stem = np.zeros(y_test.size)
-    for i, documt in enumerate(testdocs_stemmed):
-        prob_pos_case3 = np.log(P_positive)
-        prob_pos_case4 = np.log(P_positive)
-        prob_pos_case5 = np.log(P_positive)
-        prob_neg_case3 = np.log(P_negative)
-        prob_neg_case4 = np.log(P_negative)
-        prob_neg_case5 = np.log(P_negative)
-        for word in documt:
-            if word in wordlikelihood_dict["frequencydict_pos_stem"].keys():
-                #pos
-                prob_pos_case3 += np.log(wordlikelihood_dict["frequencydict_pos_stem"][word])
-                prob_pos_case4 += np.log(wordlikelihood_dict["binarydict_pos_stem"][word])
-                prob_pos_case5 += np.log(wordlikelihood_dict["tfidf_pos_stem"][word])
-                #neg
-                prob_neg_case3 += np.log(wordlikelihood_dict["frequencydict_neg_stem"][word])
-                prob_neg_case4 += np.log(wordlikelihood_dict["binarydict_neg_stem"][word])
-                prob_neg_case5 += np.log(wordlikelihood_dict["tfidf_neg_stem"][word])
-                        
-        # Stemming + Frequency count
-        if prob_pos_case3 > prob_neg_case3:
-            y_pred_freq_stem[i] = 1
-        else:
-            y_pred_freq_stem[i] = 0
-            
-        # Stemming + Binary
-        if prob_pos_case4 > prob_neg_case4:
-            y_pred_binary_stem[i] = 1
-        else:
-            y_pred_binary_stem[i] = 0
-
-        # Stemming + TFIDF
-        if prob_pos_case5 > prob_neg_case5:
-            y_pred_tfidf_stem[i] = 1
-        else:
-            y_pred_tfidf_stem[i] = 0
+    likelihoods = np.load('Stored/Likelihoods/likelihoods.npz')
+
+    predictions = []
+    for stem_name in ['', '_stem']:
+        X = load_sparse('Stored/Vectors/testbow%s_freq' % stem_name)
+        for vector_name in ['frequency', 'binary', 'tfidf']:
+            #log P(w|c) for each word in the vocabulary
+            loglikelihood_pos = np.log(likelihoods['%s_pos%s' % (vector_name, stem_name)])
+            loglikelihood_neg = np.log(likelihoods['%s_neg%s' % (vector_name, stem_name)])
+            scores = score_NB(X, loglikelihood_pos, loglikelihood_neg, P_positive, P_negative)
+            predictions.append(np.where(scores > 0, 1, 0)) #highest is chosen class
 
     #output predicted test data for evaluation
-    predictions = [y_pred_freq, y_pred_binary, y_pred_tfidf, y_pred_freq_stem, y_pred_binary_stem,y_pred_tfidf_stem] 
+    # [y_pred_freq, y_pred_binary, y_pred_tfidf, y_pred_freq_stem, y_pred_binary_stem, y_pred_tfidf_stem]
     print("NB Predictions Acquired --- %s seconds ---" % (time.time() - start_time))
     return predictions
 
@@ -700,6 +906,39 @@ def evaluate(predictions,y_test, model):
     print (cm)
     return 
 
+def evaluate_all(predictions, y_test, models, shard_size=2**20, output='results.txt'):
+    '''
+    Evaluates many classifiers at once. predictions is a (number of models x number of test documents) array of 0/1
+    predictions with one row per name in models. The confusion matrix counts of every model are computed together
+    with boolean array sums, shard_size documents at a time so the temporary arrays stay small, and accuracy,
+    precision, recall and F1 (in percent, pos is the positive class) are computed from them.
+    Returns a DataFrame with one row per model, which is printed and saved as a text table to output.
+    '''
+    print("Evaulating %s Models --- %s minutes ---" % (len(models), round((time.time() - start_time)/60,2)))
+    predictions = np.asarray(predictions)
+    y_test = np.asarray(y_test)
+    counts = np.zeros((4, len(models)), dtype=np.int64) #true negatives, false positives, false negatives, true positives
+    for start in range(0, y_test.size, shard_size):
+        predicted_pos = predictions[:, start:start+shard_size] == 1
+        actual_pos = y_test[start:start+shard_size] == 1
+        counts[0] += (~predicted_pos & ~actual_pos).sum(axis=1)
+        counts[1] += (predicted_pos & ~actual_pos).sum(axis=1)
+        counts[2] += (~predicted_pos & actual_pos).sum(axis=1)
+        counts[3] += (predicted_pos & actual_pos).sum(axis=1)
+    tn, fp, fn, tp = counts
+    def percent(numerator, denominator):
+        # 0 when the denominator is 0 (e.g. precision of a model that never predicts pos)
+        return 100 * np.divide(numerator, denominator, out=np.zeros(len(models)), where=denominator > 0)
+    precision = percent(tp, tp + fp)
+    recall = percent(tp, tp + fn)
+    results = pd.DataFrame({'accuracy': percent(tp + tn, counts.sum(axis=0)), 'precision': precision, 'recall': recall,
+                            'f1': np.divide(2 * precision * recall, precision + recall, out=np.zeros(len(models)), where=precision + recall > 0),
+                            'tn': tn, 'fp': fp, 'fn': fn, 'tp': tp}, index=pd.Index(models, name='model'))
+    print(results.round(2).to_string())
+    with open(output, 'w') as f:
+        f.write(results.round(2).to_string() + '\n')
+    return results
+
 class Logistic_Regression_L2_SGD:
     """ Defining a Logistic Regression class with L2 regularization and 
         Stochastic Gradient Descent
@@ -709,49 +948,110 @@ class Logistic_Regression_L2_SGD:
         n_iter: number of iterations over the dataset
         eta: learning rate
         batch_size: size of each batch (SGD=1 and full batch = len(X))
+        cost_every: the cost is only computed every cost_every batches (1 = every batch)
+        tol: stop early when the epoch cost hasn't improved by more than tol for n_iter_no_change
+             iterations (None = always run n_iter iterations)
+        n_iter_no_change: number of iterations without improvement before stopping
+        validation_fraction: fraction of the training data held out to score the epoch cost on
+                             (0 = the average of the batch costs of the epoch is used)
+        cost_history: number of batch costs kept in cost_values, the oldest costs are dropped first
     """
     
-    def __init__(self, l2=0.0, n_iter=1000, eta=0.05, batch_size=1):
+    def __init__(self, l2=0.0, n_iter=1000, eta=0.05, batch_size=1, cost_every=1,
+                 tol=None, n_iter_no_change=5, validation_fraction=0.0, cost_history=10000):
         self.l2 = l2
         self.n_iter = n_iter
         self.eta = eta
         self.batch_size = batch_size
+        self.cost_every = cost_every
+        self.tol = tol
+        self.n_iter_no_change = n_iter_no_change
+        self.validation_fraction = validation_fraction
+        self.cost_history = cost_history
             
     def sigmoid(self, z):
         # This is the sigmoid function of z
-        return 1/(1+ np.exp(-z))
+        # in float32 np.exp(-z) overflows to inf when z < -88, which still gives the right value of 0
+        with np.errstate(over='ignore'):
+            return 1/(1+ np.exp(-z))
+
+    def gradient_and_cost(self, x_batch, y_batch, m, get_cost=True):
+        # one pass over a batch that returns the gradient and (if get_cost) the log loss of the batch
+        # x_batch is kept sparse and cast to float32 so the products don't upcast the whole batch to float64
+        x_batch = sparse.csr_matrix(x_batch, dtype=np.float32)
+        logits = x_batch.dot(self.theta)
+        z = self.sigmoid(logits)
+        # calculating the gradient with the derived formula
+        gradient = x_batch.T.dot(z-y_batch)/m + (self.l2/m*self.theta)
+        cost = None
+        if get_cost:
+            # the log loss from the logits: -y*log(z) - (1-y)*log(1-z) = log(1+e^logit) - y*logit
+            # so no np.log of z or padding is needed
+            cost = np.average(np.logaddexp(0, logits) - y_batch*logits)
+        return gradient, cost
     
     def fit(self, X, y):
         print("Fitting Logistic Regression, eta = %s, %s iterations, L2 = %s --- %s minutes ---" % (self.eta, self.n_iter,self.l2,round((time.time() - start_time)/60,2)))
         # fit the training data
         
-        y = y.reshape(-1,1)
+        y = np.asarray(y, dtype=np.float32).reshape(-1,1)
+        # holding out a random part of the training data to score each epoch on
+        shuffled_values = np.random.permutation(y.shape[0])
+        n_valid = int(round(self.validation_fraction * y.shape[0]))
+        train_values, valid_values = np.sort(shuffled_values[n_valid:]), np.sort(shuffled_values[:n_valid])
         # initialize the values of the weights to zero
-        self.theta = np.zeros((X.shape[1],1))
-        m = y.shape[0]
-        pad = 1e-6
-        self.cost_values = []
-        for _ in range(self.n_iter):
-            # shuffling each iteration as to prevent overfitting
-            shuffled_values = np.random.permutation(m)
-            X_shuffled = X[shuffled_values]
-            y_shuffled = y[shuffled_values]
+        self.theta = np.zeros((X.shape[1],1), dtype=np.float32)
+        m = train_values.shape[0]
+        # the cost history is a ring buffer so long fits don't keep every batch cost
+        self.cost_values = deque(maxlen=self.cost_history)
+        self.epoch_costs = []
+        best_cost, no_change = np.inf, 0
+        for self.n_iter_ in range(1, self.n_iter+1):
+            batch_costs = []
             # iterating over each batch
-            for batch in range(0, m, self.batch_size):
-                x_batch = X_shuffled[batch:batch+self.batch_size]
-                y_batch = y_shuffled[batch:batch+self.batch_size]
-                z = self.sigmoid(np.dot(x_batch, self.theta))
-                # calculating the gradient with the derived formula
-                gradient = x_batch.T.dot(z-y_batch)/m + (self.l2/m*self.theta)
+            for n_batch, (x_batch, y_batch) in enumerate(self.iter_batches(X, y, train_values)):
+                # the cost is only for monitoring so it is skipped on the batches in between
+                get_cost = n_batch % self.cost_every == 0
+                gradient, cost = self.gradient_and_cost(x_batch, y_batch, m, get_cost)
                 self.theta -= self.eta * gradient
-                # implementing the cost (objective) function given
-                cost = np.average(-y_batch*np.log(z+pad) - ((1-y_batch)*np.log(1-z+pad)))
-                l2_cost = cost + (self.l2/(2*m) * np.linalg.norm(self.theta[1:])**2)  # we don't regularize the intersect
-                self.cost_values.append(l2_cost)
+                if get_cost:
+                    # implementing the cost (objective) function given
+                    l2_cost = cost + (self.l2/(2*m) * np.linalg.norm(self.theta[1:])**2)  # we don't regularize the intersect
+                    self.cost_values.append(l2_cost)
+                    batch_costs.append(l2_cost)
+
+            if self.tol is None:
+                continue
+            # the epoch cost is the cost on the held out data, or the average batch cost if nothing is held out
+            if n_valid:
+                epoch_cost = self.get_cost(X[valid_values], y[valid_values])
+            else:
+                epoch_cost = np.mean(batch_costs)
+            self.epoch_costs.append(epoch_cost)
+            if epoch_cost < best_cost - self.tol:
+                best_cost, no_change = epoch_cost, 0
+            else:
+                no_change += 1
+            if no_change >= self.n_iter_no_change:
+                print("Stopping Early After %s Iterations --- %s minutes ---" % (self.n_iter_, round((time.time() - start_time)/60,2)))
+                break
 
         return self
-    
 
+    def get_cost(self, X, y):
+        # the regularized cost of the model on X and y
+        _, cost = self.gradient_and_cost(X, np.asarray(y, dtype=np.float32).reshape(-1,1), y.shape[0])
+        return cost + (self.l2/(2*y.shape[0]) * np.linalg.norm(self.theta[1:])**2)
+
+    def iter_batches(self, X, y, rows=None):
+        # shuffling each iteration as to prevent overfitting
+        # only the row indices are shuffled, the rows are pulled from X (sparse or memory-mapped) one batch at a time
+        # rows limits the batches to those rows of X (None = every row)
+        shuffled_values = np.random.permutation(y.shape[0] if rows is None else rows)
+        for batch in range(0, len(shuffled_values), self.batch_size):
+            # sorting the rows of a batch so they are read from storage in order
+            batch_values = np.sort(shuffled_values[batch:batch+self.batch_size])
+            yield X[batch_values], y[batch_values]
     
     def predict(self, X, threshold=0.5):
         # return the predicted values in (0,1) format
@@ -764,4 +1064,7 @@ class Logistic_Regression_L2_SGD:
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # main is run from the imported HW1 module instead of __main__, otherwise the pickled objects (the models and the
+    # vocabulary dictionaries) are saved as __main__ classes that serve.py and ingest_new_reviews can't load
+    import HW1
+    HW1.main()
\ No newline at end of file
@@ -0,0 +1,189 @@
+"""
+AIT726 HW 1 pipeline benchmark
+Times each stage of the HW1 pipeline on synthetic corpora so changes to a stage can be compared against earlier runs.
+Authors: Srashti Agrawal, Billy Ermlick, Nick Newman
+Command to run the file: python benchmark.py
+i. main - creates a synthetic corpus for each size, runs every stage on it and saves the report
+    ii. make_corpus() - writes synthetic reviews in the same pos/neg folder layout as the IMDB reviews
+    iii. run_benchmark() - runs tokenize, vocab build, vectorize, likelihoods, NB predict and LR fit on one corpus
+
+Each stage records its wall time, the peak resident memory of the process (and of the tokenizing workers) while that
+stage runs (see PeakRSS) and the number of documents processed per second. The report is saved as JSON to Stored/benchmark.json.
+The corpus sizes can be changed in main, e.g. main(sizes=[10000, 100000, 1000000]).
+"""
+import os
+import glob
+import time
+import json
+import shutil
+import tempfile
+import threading
+import platform
+import numpy as np
+from collections import defaultdict
+import HW1
+
+start_time = time.time()
+emoticons = [':)', ':-)', ':(', ':-(', ':P', ':D']
+
+def make_corpus(folder, n_docs, vocab_size=50000, doc_length=230, seed=0):
+    '''
+    Writes n_docs synthetic reviews (half pos and half neg) to the pos and neg folders of folder.
+    The words are drawn from a Zipf distribution like real text and each review also has some capitalized words,
+    numbers, html tags and emoticons so every step of the tokenizer is used. Each class uses a few words more often than
+    the other class so the classifiers have something to learn.
+    '''
+    rng = np.random.default_rng(seed)
+    letters = np.array(list('abcdefghijklmnopqrstuvwxyz'))
+    words = np.array([''.join(rng.choice(letters, size=rng.integers(2, 10))) for _ in range(vocab_size)], dtype=object)
+    class_words = {'neg': words[rng.choice(vocab_size, 200, replace=False)], 'pos': words[rng.choice(vocab_size, 200, replace=False)]}
+    for label in ['neg', 'pos']:
+        os.makedirs(os.path.join(folder, label), exist_ok=True)
+    for i in range(n_docs):
+        label = 'pos' if i % 2 else 'neg'
+        tokens = list(words[np.minimum(rng.zipf(1.3, doc_length), vocab_size) - 1])
+        tokens += list(rng.choice(class_words[label], doc_length//100))
+        tokens += [tokens[0].capitalize(), str(rng.integers(1000)), '<br />', emoticons[i % len(emoticons)]]
+        rng.shuffle(tokens)
+        with open(os.path.join(folder, label, '%s_%s.txt' % (i, label)), 'w', encoding='utf8') as f:
+            f.write(' '.join(tokens) + '.')
+
+def get_rss(pid='self'):
+    # resident memory in MB of a process (None if it can't be read -- the process ended or there is no /proc)
+    try:
+        with open('/proc/%s/statm' % pid) as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024**2
+    except (OSError, ValueError):
+        return None
+
+def get_children():
+    # pids of the child processes of this process, listed in the children file of each of its threads
+    pids = []
+    for children_file in glob.glob('/proc/self/task/*/children'):
+        try:
+            with open(children_file) as f:
+                pids.extend(f.read().split())
+        except OSError: #the thread ended
+            pass
+    return pids
+
+class PeakRSS:
+    """ Peak resident memory of one stage. While the stage runs a thread reads the resident memory of this process and
+        the total of its child processes (the tokenizing workers) every interval seconds and keeps the highest values.
+        ru_maxrss can't be used for this -- it is the highest value since the process started, so a stage would report
+        the peak of whichever stage before it used the most memory.
+        The memory is read from /proc, so on systems without it (e.g. macOS) the peaks are None.
+
+    The parameters are:
+        interval: seconds between readings
+    """
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+
+    def __enter__(self):
+        self.start = get_rss()
+        self.peak = {'self': None, 'children': None}
+        self.read()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+        self.thread.start()
+        return self
+
+    def sample(self):
+        while not self.stopped.wait(self.interval):
+            self.read()
+
+    def read(self):
+        children = [get_rss(pid) for pid in get_children()]
+        for name, rss in [('self', get_rss()), ('children', sum(rss for rss in children if rss is not None) if children else None)]:
+            if rss is not None:
+                self.peak[name] = max(rss, self.peak[name] or 0)
+
+    def __exit__(self, *args):
+        self.stopped.set()
+        self.thread.join()
+        self.read()
+        # how much the stage added to the memory of this process
+        self.increase = self.peak['self'] - self.start if self.start is not None and self.peak['self'] is not None else None
+
+def run_benchmark(folder, n_jobs=None, lr_params=None):
+    '''
+    Runs each stage of the HW1 pipeline in memory on the reviews in folder. Half of the reviews are used for training
+    and half for testing like the IMDB dataset. Returns a dictionary with the wall time, peak memory and documents
+    per second of each stage.
+    '''
+    lr_params = lr_params or dict(n_iter=15, eta=0.1, l2=5, batch_size=10000)
+    stages = {}
+    def timed(stage, n_docs, function, *args):
+        with PeakRSS() as memory:
+            stage_start = time.time()
+            result = function(*args)
+            seconds = time.time() - stage_start
+        stages[stage] = {'seconds': seconds, 'docs_per_sec': n_docs/seconds if seconds else None, 'peak_rss_mb': memory.peak,
+                         'rss_increase_mb': memory.increase}
+        print("%s: %.2f seconds, %.0f docs/sec --- %s minutes ---" % (stage, seconds, n_docs/max(seconds, 1e-9), round((time.time() - start_time)/60,2)))
+        return result
+
+    paths, labels = HW1.list_reviews(folder)
+    y = np.array(labels)
+    n_docs = len(paths)
+    docs, docs_stemmed = timed('tokenize', n_docs, HW1.tokenize_paths, paths, n_jobs)
+    train, test = np.arange(0, n_docs, 2), np.arange(1, n_docs, 2)
+    train_docs, test_docs = [docs[i] for i in train], [docs[i] for i in test]
+    y_train, y_test = y[train], y[test]
+
+    def build_vocab():
+        # packing the training documents gives the vocabulary as the token table (see get_trainandtest_vocabanddocs)
+        train_corpus, test_corpus = HW1.PackedCorpus.from_docs(train_docs), HW1.PackedCorpus.from_docs(test_docs)
+        vocab_dict = defaultdict(int)
+        for k, v in enumerate(train_corpus.table):
+            vocab_dict[v] = k
+        return train_corpus, test_corpus, vocab_dict
+    train_corpus, test_corpus, vocab_dict = timed('vocab_build', n_docs, build_vocab)
+
+    def vectorize():
+        train_counts = HW1.count_matrix_from_corpus(train_corpus, vocab_dict)
+        test_counts = HW1.count_matrix_from_corpus(test_corpus, vocab_dict)
+        tfidf = HW1.TFIDF_Transformer(**HW1.tfidf_options).fit(train_counts)
+        return train_counts, test_counts, tfidf, tfidf.transform(train_counts), HW1.binary_from_counts(train_counts)
+    train_counts, test_counts, tfidf, train_tfidf, train_binary = timed('vectorize', n_docs, vectorize)
+
+    likelihoods = timed('likelihoods', len(train), lambda: HW1.get_likelihoods(*HW1.get_class_statistics(train_counts, y_train), tfidf.idf))
+
+    P_positive = np.mean(y_train)
+    def predict():
+        loglikelihood = np.log(likelihoods['frequency'])
+        return HW1.score_NB(test_counts, loglikelihood[1], loglikelihood[0], P_positive, 1 - P_positive) > 0
+    predictions = timed('nb_predict', len(test), predict)
+
+    LR_model = timed('lr_fit', len(train), HW1.Logistic_Regression_L2_SGD(**lr_params).fit, train_tfidf, y_train)
+
+    return {'n_docs': n_docs, 'n_train': len(train), 'vocabulary_size': len(vocab_dict), 'nonzeros': int(train_counts.nnz),
+            'nb_accuracy': float(np.mean(predictions == y_test)),
+            'lr_accuracy': float(np.mean(LR_model.predict(tfidf.transform(test_counts)).ravel() == y_test)),
+            'stages': stages}
+
+def main(sizes=[10000], n_jobs=None, output='Stored/benchmark.json'):
+    '''
+    Benchmarks the pipeline on a synthetic corpus of each size in sizes and saves the report to output.
+    The corpora are written to a temporary folder that is removed afterwards.
+    '''
+    report = {'python': platform.python_version(), 'numpy': np.__version__, 'cpus': os.cpu_count(), 'n_jobs': n_jobs, 'runs': []}
+    for n_docs in sizes:
+        print("Benchmarking %s Documents --- %s minutes ---" % (n_docs, round((time.time() - start_time)/60,2)))
+        folder = tempfile.mkdtemp()
+        try:
+            make_corpus(folder, n_docs)
+            report['runs'].append(run_benchmark(folder, n_jobs))
+        finally:
+            shutil.rmtree(folder)
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=1)
+    print("Report Saved To %s --- %s minutes ---" % (output, round((time.time() - start_time)/60,2)))
+    return report
+
+
+if __name__ == "__main__":
+    main()
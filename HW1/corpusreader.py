@@ -0,0 +1,32 @@
+"""
+Threaded listing of corpora that are stored as one small text file per document.
+Listing tens of thousands of tiny files spends most of its time waiting on the file system, so the subfolders of a corpus
+are listed by a pool of threads. HW1 reads each review with read_file in the tokenizing worker that tokenizes it, so only
+the reviews that are being tokenized are in memory. The threaded reader (read_files) and the packed archive of a corpus
+are in HW2/corpusreader.py.
+Command to list a corpus: paths, labels = list_corpus('Data/train')
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+
+def list_corpus(folder, n_threads=8):
+    '''
+    Lists the files of a corpus. The files of each subfolder get the name of the subfolder as their label (e.g. pos and
+    neg) and files directly in folder get the label ''. The subfolders are listed in parallel.
+    Returns the paths and labels of the files directly in folder first and then those of each subfolder. Within each
+    group the order is the os.scandir order (arbitrary, sort the paths if a fixed order is needed).
+    '''
+    entries = list(os.scandir(folder))
+    folders = [entry for entry in entries if entry.is_dir()]
+    paths = [entry.path for entry in entries if entry.is_file()]
+    labels = [''] * len(paths)
+    with ThreadPoolExecutor(n_threads) as executor:
+        for entry, files in zip(folders, executor.map(lambda entry: [f.path for f in os.scandir(entry.path) if f.is_file()], folders)):
+            paths.extend(files)
+            labels.extend([entry.name] * len(files))
+    return paths, labels
+
+def read_file(path):
+    with open(path, encoding='utf8') as f:
+        return f.read()
@@ -0,0 +1,138 @@
+"""
+AIT726 HW 1 sentiment scoring service
+Scores new reviews with the Naive Bayes and Logistic Regression models that HW1.py stored, without putting them in Data/test.
+Authors: Srashti Agrawal, Billy Ermlick, Nick Newman
+Command to run the file: python serve.py (HW1.py has to be run first so the Stored folder exists)
+i. main - loads the models once and serves them over http on localhost:8000
+    ii. SentimentScorer - loads the vocabulary, Naive Bayes log likelihoods and Logistic Regression theta and scores text
+    iii. ScoringHandler - http handler for the score endpoints
+
+Endpoints (the body of each POST request is JSON):
+    POST /score {"text": "..."} - returns {"nb": {"neg": p, "pos": p}, "lr": {"neg": p, "pos": p}}
+    POST /score_batch {"texts": ["...", ...]} - returns {"scores": [...]} with one result per text, all of the texts are
+                                                 vectorized into one sparse matrix and scored with a single product
+    GET /health - returns the models that are loaded
+"""
+import json
+import time
+import numpy as np
+from scipy.special import expit
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import HW1
+
+start_time = time.time()
+
+class SentimentScorer:
+    """ Scores reviews with the stored HW1 models. Everything that is needed is loaded once when the scorer is created,
+        so scoring a review is only tokenizing it and two sparse dot products.
+
+    The parameters are:
+        stem: use the stemmed vocabulary and models
+        nb_vector: which Naive Bayes likelihoods to use ('frequency', 'binary' or 'tfidf')
+        lr_model: name of the Logistic Regression model in HW1.LR_models (None = the TFIDF L2 model)
+        stored: folder that HW1.py saved its results to
+    """
+
+    def __init__(self, stem=False, nb_vector='frequency', lr_model=None, stored='Stored'):
+        self.stem = stem
+        stem_name = '_stem' if stem else ''
+        self.tokenizer = HW1.Tokenizer()
+        # the vocabulary dictionary, or the Hashing_Vectorizer if the vectors were hashed
+        self.vocab_dict = HW1.load_vocab_dict('%s/DocsVocab/%svocab_dict' % (stored, 'stem_' if stem else ''))
+
+        # Naive Bayes: log P(pos|d) - log P(neg|d) = counts . (log P(w|pos) - log P(w|neg)) + log P(pos) - log P(neg)
+        likelihoods = np.load('%s/Likelihoods/likelihoods.npz' % stored)
+        class_docs = np.load('%s/Likelihoods/nb_stats.npz' % stored)['class_docs' + stem_name]
+        self.nb_weights = np.log(likelihoods['%s_pos%s' % (nb_vector, stem_name)]) - np.log(likelihoods['%s_neg%s' % (nb_vector, stem_name)])
+        self.nb_bias = np.log(class_docs[1]) - np.log(class_docs[0])
+        self.nb_vector = nb_vector
+
+        # Logistic Regression: the theta of the stored model and the vectors it was trained on
+        self.lr_model = lr_model or 'LOGISTIC_TFIDF%s_L2' % ('_STEM' if stem else '')
+        models = {name: (model_file, train_vectors) for name, model_file, train_vectors, params in HW1.LR_models}
+        if self.lr_model not in models:
+            raise ValueError('Unknown Logistic Regression model %s' % self.lr_model)
+        model_file, train_vectors = models[self.lr_model]
+        if ('stem' in train_vectors) != stem:
+            raise ValueError('%s was not trained on %s vectors' % (self.lr_model, 'stemmed' if stem else 'unstemmed'))
+        self.theta = HW1.load_obj('%s/Models/%s' % (stored, model_file)).theta.ravel()
+        self.tfidf = None
+        if 'tfidf' in train_vectors:
+            self.tfidf = HW1.TFIDF_Transformer(**HW1.tfidf_options)
+            self.tfidf.idf = np.load('%s/Vectors/idf%s.npy' % (stored, stem_name))
+        self.binary = 'binary' in train_vectors
+        print("Models Loaded --- %s minutes ---" % (round((time.time() - start_time)/60,2)))
+
+    def vectorize(self, texts):
+        # frequency count matrix of the texts with the training vocabulary and the counts the Logistic Regression vectors
+        # are made from (the signed hashed counts if the vectors were hashed with hashing_signed, see HW1.get_vectors)
+        docs = self.tokenizer.tokenize_many(texts, stem=self.stem)
+        counts = HW1.build_count_matrix(docs, self.vocab_dict)
+        if getattr(self.vocab_dict, 'signed', False):
+            return counts, self.vocab_dict.transform(docs)
+        return counts, counts
+
+    def score_batch(self, texts):
+        # class probabilities of each text for both models
+        counts, lr_counts = self.vectorize(texts)
+        nb_positive = expit(counts.dot(self.nb_weights) + self.nb_bias)
+        if self.tfidf is not None:
+            lr_vectors = self.tfidf.transform(lr_counts)
+        elif self.binary:
+            lr_vectors = HW1.binary_from_counts(lr_counts)
+        else:
+            lr_vectors = lr_counts
+        lr_positive = expit(lr_vectors.dot(self.theta))
+        return [{'nb': {'neg': 1 - nb, 'pos': nb}, 'lr': {'neg': 1 - lr, 'pos': lr}}
+                for nb, lr in zip(nb_positive.tolist(), lr_positive.tolist())]
+
+    def score(self, text):
+        return self.score_batch([text])[0]
+
+class ScoringHandler(BaseHTTPRequestHandler):
+    """ http handler for the scoring endpoints. The scorer is shared by every request through the server. """
+
+    def send_json(self, status, body):
+        response = json.dumps(body).encode('utf8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def do_GET(self):
+        if self.path != '/health':
+            return self.send_json(404, {'error': 'unknown path %s' % self.path})
+        scorer = self.server.scorer
+        self.send_json(200, {'stem': scorer.stem, 'nb_vector': scorer.nb_vector, 'lr_model': scorer.lr_model})
+
+    def do_POST(self):
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            if self.path == '/score':
+                return self.send_json(200, self.server.scorer.score(request['text']))
+            if self.path == '/score_batch':
+                return self.send_json(200, {'scores': self.server.scorer.score_batch(request['texts'])})
+        except (ValueError, KeyError, TypeError) as error:
+            return self.send_json(400, {'error': 'bad request: %r' % error})
+        self.send_json(404, {'error': 'unknown path %s' % self.path})
+
+    def log_message(self, format, *args):
+        # the default handler prints every request to stderr
+        pass
+
+def main(host='localhost', port=8000, **scorer_params):
+    '''
+    Loads a SentimentScorer with scorer_params and serves it until the process is stopped.
+    '''
+    server = ThreadingHTTPServer((host, port), ScoringHandler)
+    server.scorer = SentimentScorer(**scorer_params)
+    print("Serving On http://%s:%s --- %s minutes ---" % (host, port, round((time.time() - start_time)/60,2)))
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
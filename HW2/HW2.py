@@ -4,24 +4,23 @@ Language modeling using bigrams and a feedforward net wfor 1000 reviews
 Authors: Srashti Agrawal, Billy Ermlick, Nick Newman
 Command to run the file: python HW2.py 
 i. main - runs all of the functions
-    i. get_docs - tokenizes all tweets, returns a list of tokenized sentences and a list of all tokens
-    ii. get_ngrams_vector - creates the context and label numpy arrays from the tokenized sentences
-    iii. run_neural_network - splits numpy arrays into train,validation, and test sets. Runs on NN. Outputs accuracy on test set.
+    i. get_docs - tokenizes all tweets, returns a list of tokenized sentences
+    ii. get_ngrams_vector - creates the real n-grams (any n) and the sampler of fake grams from the tokenized sentences
+    iii. run_neural_network - splits the grams into train,validation, and test sets streamed with fake grams (get_dataloaders). Runs on NN. Outputs accuracy on test set.
     iv. pretrained_embedding_run_NN - same function as iii, except pretrained embedding vectors can be used
 """
 import os
 import re
 import time
 import numpy as np
-import itertools
-from nltk.util import ngrams
 from nltk import word_tokenize
 from nltk import sent_tokenize
-from collections import defaultdict
+from corpusreader import list_corpus, read_files, pack_corpus, read_archive
+from packedcorpus import PackedCorpus
+from embeddingcache import EmbeddingCache
 from sklearn.metrics import confusion_matrix
 from sklearn.model_selection import train_test_split
 from statistics import mean
-import random
 import torch.utils.data as data_utils
 import torch
 import torch.nn.functional as F
@@ -34,20 +33,204 @@ start_time = time.time()
 emoticon_string = r"(:\)|:-\)|:\(|:-\(|;\);-\)|:-O|8-|:P|:D|:\||:S|:\$|:@|8o\||\+o\(|\(H\)|\(C\)|\(\?\))"
 #https://www.regexpal.com/96995
 
-def main():
+class Tokenizer:
+    """ Remove any markup tags, e.g., HTML
+    tags, from the data. Lower case capitalized words (i.e., starts with a capital letter) but not all
+    capital words (e.g., USA). Do not remove stopwords. Tokenize at white space and also at each
+    punctuation. Consider emoticons in this process.
+    Tokenizer that tokenizes text. Also finds and tokenizes emoji faces.
+    The regular expressions are compiled once when the tokenizer is created instead of on every call.
+    """
+    # numbers used to be removed before the html tags, so a tag has to contain something that isn't a number
+    # ("<1>" becomes "<>" and is kept). With that rule both can be removed in the same pass.
+    remove_regex = re.compile(r'<\d*[^>\d][^>]*>|\d+')
+    capital_regex = re.compile('([A-Z][a-z]+)')
+    emoticon_regex = re.compile(emoticon_string)
+
+    def tokenize(self, txt):
+        txt = self.remove_regex.sub('', txt) #remove numbers and html tags
+        txt = self.capital_regex.sub(lambda match: match.group(1).lower(), txt) #lowercase words that start with captial
+        # split based on emoji faces first -- every odd element of the split is an emoticon, after the emoji
+        # tokenizing is done, do basic word tokenizing with what is left
+        fragments = self.emoticon_regex.split(txt)
+        tokens = []
+        for n, fragment in enumerate(fragments):
+            if n % 2:
+                tokens.append(fragment)
+            elif fragment:
+                tokens.extend(word_tokenize(fragment))
+        # tokens.insert(0, '_start_') #for use if trying to actually make sentences
+        # tokens.append('_end_')
+        return tokens
+
+    def tokenize_many(self, texts):
+        # tokenizes every text in an iterable of texts, returns a list of token lists
+        return [self.tokenize(txt) for txt in texts]
+
+
+class Negative_Sampler:
+    """ Draws the fake (negative) second words of the grams. The words are drawn from the unigram distribution of the
+    corpus (raised to power, 0.75 flattens it like word2vec) with an alias table, so every draw is O(1) and all of the
+    draws are made with a few numpy calls. A drawn word is rejected when it is the first word itself or when the pair
+    is a real bigram of the corpus. The real bigrams are kept as one sorted int64 array of first*vocab_size + second,
+    so checking every draw at once is a single searchsorted.
+
+    The parameters are:
+        tokens: token id array of the corpus (the unigram counts are taken from it)
+        pairs: (n, 2) array of the real bigrams
+        vocab_size: number of token ids
+        power: exponent of the unigram counts (1 = the word frequencies)
+        seed: seed of the random generator
+    """
+
+    def __init__(self, tokens, pairs, vocab_size, power=1.0, seed=None):
+        self.vocab_size = vocab_size
+        self.rng = np.random.default_rng(seed)
+        self.successors = np.unique(pairs[:, 0].astype(np.int64) * vocab_size + pairs[:, 1])
+        self.prob, self.alias = self.alias_table(np.bincount(tokens, minlength=vocab_size) ** power)
+
+    @staticmethod
+    def alias_table(weights):
+        # Vose's alias method: each column i keeps word i with probability prob[i] and otherwise gives alias[i]
+        n = len(weights)
+        scaled = weights / weights.sum() * n
+        prob = np.ones(n)
+        alias = np.arange(n)
+        small = list(np.flatnonzero(scaled < 1))
+        large = list(np.flatnonzero(scaled >= 1))
+        while small and large:
+            s, l = small.pop(), large.pop()
+            prob[s], alias[s] = scaled[s], l
+            scaled[l] -= 1 - scaled[s]
+            (small if scaled[l] < 1 else large).append(l)
+        return prob, alias
+
+    def draw(self, n):
+        # n words from the unigram distribution
+        columns = self.rng.integers(self.vocab_size, size=n)
+        return np.where(self.rng.random(n) < self.prob[columns], columns, self.alias[columns])
+
+    def is_rejected(self, firsts, seconds):
+        # True where the second word is the first word or the pair is a real bigram
+        if not len(self.successors): #no real bigrams (e.g. every sentence is one word)
+            return firsts == seconds
+        keys = firsts.astype(np.int64) * self.vocab_size + seconds
+        found = self.successors[np.minimum(np.searchsorted(self.successors, keys), len(self.successors) - 1)] == keys
+        return found | (firsts == seconds)
+
+    def sample(self, firsts):
+        # a fake second word for every first word, only the rejected draws are drawn again
+        seconds = self.draw(len(firsts))
+        rejected = np.flatnonzero(self.is_rejected(firsts, seconds))
+        while len(rejected):
+            seconds[rejected] = self.draw(len(rejected))
+            rejected = rejected[self.is_rejected(firsts[rejected], seconds[rejected])]
+        return seconds
+
+
+class Context_Windows:
+    """ The n-grams of the sentences as the index where each n-gram starts in the token id array of the corpus. An n-gram
+    is a row of a strided view of the token ids (sliding_window_view), so no n-gram is stored and the rows of a batch are
+    only gathered when they are needed. The same index works for bigrams, trigrams or any n.
+
+    The parameters are:
+        tokens: token id array of the corpus
+        starts: index in tokens of the first word of each n-gram
+        n: number of words in each n-gram
+    """
+
+    def __init__(self, tokens, starts, n):
+        self.tokens = tokens
+        self.starts = starts
+        self.n = n
+
+    @classmethod
+    def from_corpus(cls, corpus, n):
+        # creating the ngrams from each sentence, so that ngrams from the end of one sentence aren't combined with the
+        # beginning of another sentence -- an n-gram starts at every token with n-1 more tokens in its sentence
+        ends = np.repeat(corpus.offsets[1:], np.diff(corpus.offsets))
+        return cls(corpus.tokens, np.flatnonzero(np.arange(len(corpus.tokens)) + n <= ends), n)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, index):
+        # (number of n-grams, n) array of the n-grams at index (the view is made here so it is never pickled)
+        return np.lib.stride_tricks.sliding_window_view(self.tokens, self.n)[self.starts[index]]
+
+    def subset(self, index):
+        # the n-grams at index, sharing the token id array
+        return Context_Windows(self.tokens, self.starts[index], self.n)
+
+
+class Gram_Stream(data_utils.IterableDataset):
+    """ Streams batches of real and fake grams to the DataLoader. Only the start index of the real grams is stored (see
+    Context_Windows), the fake grams of each batch are drawn by the Negative_Sampler when the batch is made, so every
+    epoch sees new fake grams and the memory is proportional to the corpus. A fake gram keeps the context of its real
+    gram and gets a new last word, which can't be the word before it or a real bigram with it.
+    With num_workers > 0 each worker process streams its own share of the real grams and draws its fake grams with its
+    own random generator.
+    For the validation and test sets the fake grams are drawn once (fixed=True) so the accuracy of each epoch is
+    measured on the same samples.
+
+    The parameters are:
+        windows: Context_Windows of the real grams
+        sampler: Negative_Sampler that draws the fake last words
+        batch_size: number of samples (real and fake) in each batch
+        negatives: number of fake grams for each real gram
+        fixed: draw the fake grams once instead of for every batch
+        shuffle: shuffle the real grams every epoch
+    """
+
+    def __init__(self, windows, sampler, batch_size, negatives=2, fixed=False, shuffle=False):
+        self.windows = windows
+        self.sampler = sampler
+        self.negatives = negatives
+        self.shuffle = shuffle
+        self.n_real = max(1, batch_size // (negatives + 1)) #real grams in each batch
+        self.fakes = self.sample_fakes(windows[:]) if fixed else None
+
+    def sample_fakes(self, grams):
+        # the fake last words of each real gram, drawn after the word before the last word
+        return self.sampler.sample(np.repeat(grams[:, -2], self.negatives))
+
+    def __iter__(self):
+        order = np.arange(len(self.windows))
+        worker = data_utils.get_worker_info()
+        if worker is not None:
+            order = order[worker.id::worker.num_workers]
+            self.sampler.rng = np.random.default_rng(worker.seed) #the seed of each worker changes every epoch
+        if self.shuffle:
+            self.sampler.rng.shuffle(order)
+        for start in range(0, len(order), self.n_real):
+            index = order[start:start+self.n_real]
+            real = self.windows[index]
+            fake = np.repeat(real, self.negatives, axis=0)
+            if self.fakes is None:
+                fake[:, -1] = self.sample_fakes(real)
+            else:
+                fake[:, -1] = self.fakes[(index[:, None]*self.negatives + np.arange(self.negatives)).ravel()]
+            context = torch.from_numpy(np.concatenate([real, fake]).astype(np.int64))
+            label = torch.cat([torch.ones(len(real), 1), torch.zeros(len(fake), 1)])
+            yield context, label
+
+
+def main(n=2, archive=None):
     '''
     The main function. This is used to get/tokenize the documents, create vectors for input into the language model based on
     a number of grams, and input the vectors into the model for training and evaluation.
+    n is the number of words in each gram (2 = bigram model, 3 = trigram model, ...)
+    archive is the packed archive to read the documents from (None = read the files, see get_docs)
     '''
     print("--- Start Program --- %s seconds ---" % (round((time.time() - start_time),2)))
-    docs, sentences = get_docs() 
-    ngram_array, ngram_label_array, vocab_size, vocab = get_ngrams_vector(docs,sentences) 
-    run_neural_network(ngram_array, ngram_label_array, vocab_size)
-    pretrained_embedding_run_NN(ngram_array, ngram_label_array, vocab_size, vocab)
+    sentences = get_docs(archive) 
+    windows, sampler, vocab_size, vocab = get_ngrams_vector(sentences, n) 
+    run_neural_network(windows, sampler, vocab_size)
+    pretrained_embedding_run_NN(windows, sampler, vocab_size, vocab)
     return
 
 
-def get_docs():
+def get_docs(archive=None):
 
     '''
     Pre-processing: Read the complete data word by word. Remove any markup tags, e.g., HTML
@@ -59,120 +242,90 @@ def get_docs():
     This function tokenizes and gets all of the text from the documents. it also divides the text into sentences 
     and tokenizes each sentence. That way our model doesn't learn weird crossovers between the end of one sentence
     to the start of another. 
+    The files are streamed through iter_sentences one at a time, so nothing is built by joining the text of every
+    file and the time and memory grow linearly with the corpus.
+    If archive is given (e.g. 'LanguageModelingData_packed') the files are read sequentially from that archive instead of
+    being opened one by one (see corpusreader.pack_corpus). It is packed the first time -- delete the archive files to
+    pack it again after the data changes.
     '''
-
-    def tokenize(txt):
-        """
-        Remove any markup tags, e.g., HTML
-        tags, from the data. Lower case capitalized words (i.e., starts with a capital letter) but not all
-        capital words (e.g., USA). Do not remove stopwords. Tokenize at white space and also at each
-        punctuation. Consider emoticons in this process. You can use an emoticon tokenizer, if you so
-        choose.
-        Tokenizer that tokenizes text. Also finds and tokenizes emoji faces.
-        """
-        txt = re.sub(r'\d+', '', txt) #remove numbers
-        def lower_repl(match):
-            return match.group(1).lower()
-
-        # txt = r"This is a practice tweet :). Let's hope our-system can get it right. \U0001F923 something."
-        txt = re.sub('(?:<[^>]+>)', '', txt)# remove html tags
-        txt = re.sub('([A-Z][a-z]+)',lower_repl,txt) #lowercase words that start with captial
-        tokens = re.split(emoticon_string,txt) #split based on emoji faces first 
-        tokensfinal = []
-        for i in tokens: #after the emoji tokenizing is done, do basic word tokenizing with what is left
-            if not re.match(emoticon_string,i):
-                to_add = word_tokenize(i)
-                tokensfinal = tokensfinal + to_add
-            else:
-                tokensfinal.append(i)
-        # tokensfinal.insert(0, '_start_') #for use if trying to actually make sentences
-        # tokensfinal.append('_end_')
-        return tokensfinal
-
-    #initalize variables
-    alltext = ''
-    docs = []
-    sentences = []
-    #create megadocument of all tweets
-    for f in os.listdir('LanguageModelingData'):
-        tweet = open(os.path.join('LanguageModelingData',f),encoding="utf8").read()
-        alltext = alltext + ' ' + tweet #all tweet text joined
-    
-    sentences = sent_tokenize(alltext) #divide text into sentences
-    token_sentences = [tokenize(sentence) for sentence in sentences] #tokenize each sentence
-    #get all of the tokens in the tokenized sentences
-    for sentence in token_sentences:
-        docs.extend(sentence)
+    if archive:
+        if not os.path.exists(archive + '.npz'): #the index is saved last, so it only exists for a finished archive
+            pack_corpus('LanguageModelingData', archive)
+        texts = (text for label, text in read_archive(archive))
+    else:
+        paths, labels = list_corpus('LanguageModelingData')
+        texts = read_files(paths) #read by a pool of threads
+    token_sentences = list(iter_sentences(texts)) #tokenize each sentence
     print("--- Text Extracted --- %s seconds ---" % (round((time.time() - start_time),2)))   
-    return docs, token_sentences 
+    return token_sentences
 
 
-def get_ngrams_vector(docs, sentences):
+def iter_sentences(texts):
+    '''
+    Generator pipeline that divides the text of each file (from a generator of the texts, see corpusreader) into
+    sentences and yields each sentence tokenized. Sentences are split within each file, so a sentence never runs from
+    the end of one tweet into the next.
+    '''
+    tokenizer = Tokenizer()
+    for text in texts:
+        for sentence in sent_tokenize(text): #divide text into sentences
+            yield tokenizer.tokenize(sentence)
+
+
+def pack_sentences(sentences):
+    '''
+    Packs the tokenized sentences into one array of token ids with the offset of each sentence (see PackedCorpus).
+    The token table holds every unique token, so it is the vocabulary and the token ids are the word indices.
+    '''
+    return PackedCorpus.from_docs(sentences)
+
+def get_ngrams_vector(sentences, n=2):
     '''
     Construct your n-grams: Create positive n-gram samples by collecting all pairs of adjacent
     tokens. Create 2 negative samples for each positive sample by keeping the first word the same
     as the positive sample, but randomly sampling the rest of the corpus for the second word. The
     second word can be any word in the corpus except for the first word itself. 
     
-    This functions takes the docs and tokenized sentences and creates the numpyarrays needed for the neural network.
-    --creates 2 fake grams for every real gram 
+    This functions takes the tokenized sentences and creates the arrays needed for the neural network.
+    The sentences are packed into token ids first, so the grams are built from integer arrays instead of strings.
+    The grams have n words (see Context_Windows), for n > 2 the fake grams keep the first n-1 words and sample the last one.
+    --returns the real grams and the Negative_Sampler that creates 2 fake grams for every real gram while the networks
+    are trained (see Gram_Stream), so the fake grams are never all stored at once
     '''
+    corpus = pack_sentences(sentences)
+    windows = Context_Windows.from_corpus(corpus, n)
     
-    ## creating the ngrams from each sentence, so that ngrams from the end
-    # of one sentence aren't combined with the beginning of another sentence
-    ngram_list = []
-    for sentence in sentences:
-        for gram in ngrams(sentence, 2):
-            ngram_list.append(gram)
-    
-    # dictionary with the key being the first term in the bigram and the values
-    # being the second terms
-    ngram_dict = defaultdict(list)
-    for gram in ngram_list:
-        ngram_dict[gram[0]].append(gram[1]) 
-    
-    # creating fake ngrams by ensuring that the value is not a duplicate of the
-    # key and is also not one of the values for a correct bigram
-    fakegrams = []     
-    for gram in ngram_list:
-        # get two fake ngrams for each correct one
-        for _ in range(2): 
-            random_word = random.choice(docs)
-            while random_word == gram[0] or random_word in ngram_dict[gram[0]]: #pick words until not duplicate word and not correct bigram
-                random_word = random.choice(docs)
-            fakegrams.append((gram[0], random_word))
-    
-    #assigning labels for both real and fake grams 
-    gramvec, labels = [], [] 
-    for element in ngram_list:
-        gramvec.append([element[0],element[1]])
-        labels.append([1])
-    for element in fakegrams:
-        gramvec.append([element[0],element[1]])
-        labels.append([0])
-
-    vocab = set(docs) #set vocab as unique words
-    word_to_ix = {word: i for i, word in enumerate(vocab)} #index vocabulary
-    
-    ngramlabeled = [[gram] + label for gram, label in zip(gramvec,labels)] #put them together into a list of lists to be iterated
+    # the fake ngrams are drawn by ensuring that the value is not a duplicate of the
+    # key and is also not one of the values for a correct bigram (see Negative_Sampler)
+    # words are drawn from the unigram counts of the corpus, so they follow the word frequencies like before
+    sampler = Negative_Sampler(corpus.tokens, Context_Windows.from_corpus(corpus, 2)[:], len(corpus.table))
 
-    ngram_values = [] #array of word index for ngrams 
-    for context, label in ngramlabeled:
-        ngram_values.append([word_to_ix[w] for w in context])
-    
-    ngram_labels = [] # list of labels for ngrams
-    for context, label in ngramlabeled:
-        ngram_labels.append([label])
-    
-    #convert to numpy array for use in torch
-    ngram_array = np.array(ngram_values)
-    ngram_label_array = np.array(ngram_labels) 
+    vocab = corpus.table.tolist() #vocabulary in the order of the word indices
     
     print("--- Grams Created --- %s seconds ---" % (round((time.time() - start_time),2)))
-    return ngram_array, ngram_label_array, len(vocab), vocab
+    return windows, sampler, len(vocab), vocab
 
 
-def run_neural_network(ngram_array, ngram_label_array, vocab_size):
+def get_dataloaders(windows, sampler, batch_size, num_workers=2):
+    '''
+    Randomly splits the real grams into a training, validation, and test set (20% for testing and 20% of the rest for
+    validation) and creates a DataLoader of Gram_Stream batches for each. The training fake grams are drawn again
+    every epoch by num_workers worker processes, the validation and test fake grams are drawn once.
+    '''
+    train_index, test_index = train_test_split(np.arange(len(windows)), test_size=0.2, random_state=1234, shuffle=True)
+    train_index, valid_index = train_test_split(train_index, test_size=0.2, random_state=1234, shuffle=True)
+    sampler.rng = np.random.default_rng(1234) #the same validation and test fake grams on every run
+    valid = Gram_Stream(windows.subset(valid_index), sampler, batch_size, fixed=True)
+    test = Gram_Stream(windows.subset(test_index), sampler, batch_size, fixed=True)
+    train = Gram_Stream(windows.subset(train_index), sampler, batch_size, shuffle=True)
+    # the datasets make the batches themselves, so batch_size=None
+    trainloader = data_utils.DataLoader(train, batch_size=None, num_workers=num_workers)
+    validloader = data_utils.DataLoader(valid, batch_size=None)
+    testloader = data_utils.DataLoader(test, batch_size=None)
+    return trainloader, validloader, testloader
+
+
+def run_neural_network(windows, sampler, vocab_size):
     '''
     Create your training and test data: Split your generated samples into training and test sets
     randomly. Keep 20% for testing. Use the rest for training.
@@ -190,38 +343,13 @@ def run_neural_network(ngram_array, ngram_label_array, vocab_size):
     
     BATCH_SIZE = 100 # 1000 maxes memory for 8GB GPU -- keep set to 1 to predict all test cases in current implementation
 
-    #randomly split into test and validation sets
-    X_train, X_test, y_train, y_test = train_test_split(ngram_array, ngram_label_array, test_size=0.2, 
-                                                       random_state=1234, shuffle=True, stratify=ngram_label_array)
-    X_train, X_valid, y_train, y_valid = train_test_split(X_train, y_train, test_size=0.2, 
-                                                       random_state=1234, shuffle=True, stratify=y_train)
-    
-    #set datatypes 
-    X_train = torch.from_numpy(X_train)
-    X_train = X_train.long()
-    y_train = torch.from_numpy(y_train)
-    y_train = y_train.float()
-    X_valid = torch.from_numpy(X_valid)
-    X_valid = X_valid.long()
-    y_valid = torch.from_numpy(y_valid)
-    y_valid = y_valid.float()
-    X_test = torch.from_numpy(X_test)
-    X_test = X_test.long()
-    y_test = torch.from_numpy(y_test)
-    y_test = y_test.float()
-    
-    #create datsets for loading into models
-    train = data_utils.TensorDataset(X_train, y_train)
-    valid = data_utils.TensorDataset(X_valid, y_valid)
-    test = data_utils.TensorDataset(X_test, y_test)
-    trainloader = data_utils.DataLoader(train, batch_size=BATCH_SIZE, shuffle=False)
-    validloader = data_utils.DataLoader(valid, batch_size=BATCH_SIZE, shuffle=False)
-    testloader = data_utils.DataLoader(test, batch_size=BATCH_SIZE, shuffle=False)
+    #randomly split into training, validation and test sets of streamed batches
+    trainloader, validloader, testloader = get_dataloaders(windows, sampler, BATCH_SIZE)
     
     
     #edit as deisred
     EMBEDDING_DIM = 25 # embeddings dimensions
-    CONTEXT_SIZE = 2 #bigram model
+    CONTEXT_SIZE = windows.n #words in each gram (2 = bigram model)
     HIDDEN_SIZE = 20 # nodes in hidden layer
 
     class NGramLanguageModeler(nn.Module):
@@ -264,9 +392,6 @@ def run_neural_network(ngram_array, ngram_label_array, vocab_size):
     model.apply(random_weights)
     model.to(device)
     optimizer = optim.SGD(model.parameters(), lr=0.0001) #learning rate set to 0.0001 to converse faster -- change to 0.00001 if desired
-    yhat_list = []
-    context_list = []
-    labels = []
     
     accuracy_list = []
     best_accuracy = 0 
@@ -282,11 +407,8 @@ def run_neural_network(ngram_array, ngram_label_array, vocab_size):
             label = label.to(device)
             yhat = model.forward(context, CONTEXT_SIZE, EMBEDDING_DIM) #required dimensions for batching
             yhat = yhat.view(-1,1)
-            yhat_list.append(yhat)
-            context_list.append(context)
 
             # Compute Binary Cross-Entropy
-            labels.append(label)
             loss = loss_function(yhat, label)
     
             # Step 5. Do the backward pass and update the gradient
@@ -340,68 +462,31 @@ def run_neural_network(ngram_array, ngram_label_array, vocab_size):
     return
 
 
-def pretrained_embedding_run_NN(ngram_array, ngram_label_array, vocab_size, vocab):
+def pretrained_embedding_run_NN(windows, sampler, vocab_size, vocab):
     '''
     This function is the same as run_neural_network except it uses pretrained embeddings loaded from a file
     '''
     BATCH_SIZE = 500 # 1000 maxes memory for 8GB GPU
 
-    #randomly split into test and validation sets
-    X_train, X_test, y_train, y_test = train_test_split(ngram_array, ngram_label_array, test_size=0.2, 
-                                                       random_state=1234, shuffle=True, stratify=ngram_label_array)
-    X_train, X_valid, y_train, y_valid = train_test_split(X_train, y_train, test_size=0.2, 
-                                                       random_state=1234, shuffle=True, stratify=y_train)
-    
-    #set datatypes 
-    X_train = torch.from_numpy(X_train)
-    X_train = X_train.long()
-    y_train = torch.from_numpy(y_train)
-    y_train = y_train.float()
-    X_valid = torch.from_numpy(X_valid)
-    X_valid = X_valid.long()
-    y_valid = torch.from_numpy(y_valid)
-    y_valid = y_valid.float()
-    X_test = torch.from_numpy(X_test)
-    X_test = X_test.long()
-    y_test = torch.from_numpy(y_test)
-    y_test = y_test.float()
-    
-    #create datsets for loading into models
-    train = data_utils.TensorDataset(X_train, y_train)
-    valid = data_utils.TensorDataset(X_valid, y_valid)
-    test = data_utils.TensorDataset(X_test, y_test)
-    trainloader = data_utils.DataLoader(train, batch_size=BATCH_SIZE, shuffle=False)
-    validloader = data_utils.DataLoader(valid, batch_size=BATCH_SIZE, shuffle=False)
-    testloader = data_utils.DataLoader(test, batch_size=BATCH_SIZE, shuffle=False)
+    #randomly split into training, validation and test sets of streamed batches
+    trainloader, validloader, testloader = get_dataloaders(windows, sampler, BATCH_SIZE)
     
     
     EMBEDDING_DIM = 200 # embeddings dimensions
-    CONTEXT_SIZE = 2 #bigram model
+    CONTEXT_SIZE = windows.n #words in each gram (2 = bigram model)
     
-    # getting embeddings from the file
+    # getting embeddings from the file -- converted once to a memory-mapped cache (see embeddingcache)
     EMBEDDING_FILE = "glove.6B.200d.txt"
-    embeddings_index = {}
-    words = []
-    with open (EMBEDDING_FILE, encoding="utf8") as f:
-        for line in f:
-            values = line.split()
-            word = values[0]
-            words.append(word)
-            embedding = np.asarray(values[1:], dtype='float32')
-            embeddings_index[word] = embedding
+    embeddings_index = EmbeddingCache.open(EMBEDDING_FILE)
 
     matrix_len = vocab_size
     weights_matrix = np.zeros((matrix_len, EMBEDDING_DIM)) # 200 is depth of embedding matrix
-    words_found = 0
-    words_not_found = 0
-    for i, word in enumerate(vocab):
-        try:
-            weights_matrix[i] = embeddings_index[word]
-            words_found += 1
-        
-        except KeyError:
-            weights_matrix[i] = np.random.normal(scale=0.6, size=(EMBEDDING_DIM,)) #randomize out of vocabulary words
-            words_not_found += 1
+    rows = embeddings_index.find_rows(vocab) #row of every vocabulary word in the embeddings (-1 if it isn't in them)
+    found = rows >= 0
+    weights_matrix[found] = embeddings_index.vectors[rows[found]]
+    weights_matrix[~found] = np.random.normal(scale=0.6, size=((~found).sum(), EMBEDDING_DIM)) #randomize out of vocabulary words
+    words_found = int(found.sum())
+    words_not_found = matrix_len - words_found
     
     print("{:.2f}% ({}/{}) of the vocabulary were in the pre-trained embedding.".format(words_found/vocab_size,words_found,vocab_size))
     
@@ -439,9 +524,6 @@ def pretrained_embedding_run_NN(ngram_array, ngram_label_array, vocab_size, voca
     #model.apply(random_weights)
     model.to(device)
     optimizer = optim.SGD(model.parameters(), lr=0.0001) #learning rate set to 0.0001 to converse faster -- change to 0.00001 if desired
-    yhat_list = []
-    context_list = []
-    labels = []
 
     best_accuracy = 0
     accuracy_list = []
@@ -457,11 +539,8 @@ def pretrained_embedding_run_NN(ngram_array, ngram_label_array, vocab_size, voca
             label = label.to(device)
             yhat = model.forward(context, CONTEXT_SIZE, EMBEDDING_DIM)
             yhat = yhat.view(-1,1)
-            yhat_list.append(yhat)
-            context_list.append(context)
 
             # Compute Binary Cross-Entropy
-            labels.append(label)
             loss = loss_function(yhat, label)
     
             # Step 5. Do the backward pass and update the gradient
@@ -0,0 +1,84 @@
+"""
+Threaded reading of corpora that are stored as one small text file per document.
+Reading tens of thousands of tiny files one at a time spends most of its time waiting on open/read/close calls, so the
+files are listed and read by a pool of threads (file reads release the GIL) and handed back in order as a generator.
+A corpus can also be packed into a single archive file with an index of offsets and lengths, so later runs read it
+sequentially in large blocks instead of opening every file.
+Command to read a corpus: for label, text in read_corpus('Data/train'): ...
+HW2.get_docs(archive=...) reads LanguageModelingData from an archive. HW1/corpusreader.py only keeps list_corpus and read_file,
+since the HW1 tokenizing workers read the reviews themselves.
+"""
+import os
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+
+def list_corpus(folder, n_threads=8):
+    '''
+    Lists the files of a corpus. The files of each subfolder get the name of the subfolder as their label (e.g. pos and
+    neg) and files directly in folder get the label ''. The subfolders are listed in parallel.
+    Returns the paths and labels of the files directly in folder first and then those of each subfolder. Within each
+    group the order is the os.scandir order (arbitrary, sort the paths if a fixed order is needed).
+    '''
+    entries = list(os.scandir(folder))
+    folders = [entry for entry in entries if entry.is_dir()]
+    paths = [entry.path for entry in entries if entry.is_file()]
+    labels = [''] * len(paths)
+    with ThreadPoolExecutor(n_threads) as executor:
+        for entry, files in zip(folders, executor.map(lambda entry: [f.path for f in os.scandir(entry.path) if f.is_file()], folders)):
+            paths.extend(files)
+            labels.extend([entry.name] * len(files))
+    return paths, labels
+
+def read_file(path):
+    with open(path, encoding='utf8') as f:
+        return f.read()
+
+def read_files(paths, n_threads=16, chunksize=1024):
+    '''
+    Generator of the text of each file in paths, in order. The files are read by n_threads threads, chunksize files at
+    a time so only a chunk of the corpus is in memory at once.
+    '''
+    with ThreadPoolExecutor(n_threads) as executor:
+        for start in range(0, len(paths), chunksize):
+            yield from executor.map(read_file, paths[start:start+chunksize])
+
+def read_corpus(folder, n_threads=16):
+    '''
+    Generator of (label, text) for every file of a corpus folder (see list_corpus).
+    '''
+    paths, labels = list_corpus(folder)
+    yield from zip(labels, read_files(paths, n_threads))
+
+def pack_corpus(folder, archive, n_threads=16):
+    '''
+    Packs every file of a corpus folder into one archive. archive.bin holds the utf8 text of the files one after another
+    and archive.npz holds the offset and length of each file in archive.bin with its path and label.
+    '''
+    paths, labels = list_corpus(folder)
+    offsets = np.zeros(len(paths), dtype=np.int64)
+    lengths = np.zeros(len(paths), dtype=np.int64)
+    position = 0
+    with open(archive + '.bin', 'wb') as f:
+        for i, text in enumerate(read_files(paths, n_threads)):
+            data = text.encode('utf8')
+            f.write(data)
+            offsets[i], lengths[i] = position, len(data)
+            position += len(data)
+    np.savez(archive, offsets=offsets, lengths=lengths, paths=np.array(paths), labels=np.array(labels))
+
+def read_archive(archive, block_size=2**24):
+    '''
+    Generator of (label, text) for every file in an archive made by pack_corpus, in the order they were packed.
+    The archive is read sequentially block_size bytes at a time.
+    '''
+    index = np.load(archive + '.npz')
+    offsets, lengths, labels = index['offsets'], index['lengths'], index['labels']
+    with open(archive + '.bin', 'rb') as f:
+        block, block_start = b'', 0
+        for offset, length, label in zip(offsets, lengths, labels):
+            # read blocks until the whole file is in the buffer
+            while offset + length > block_start + len(block):
+                block = block[offset - block_start:] + f.read(max(block_size, int(length)))
+                block_start = offset
+            yield str(label), block[offset - block_start:offset - block_start + length].decode('utf8')
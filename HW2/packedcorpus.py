@@ -0,0 +1,137 @@
+"""
+Compact storage for tokenized documents.
+A list of tokenized documents is stored as one contiguous int32 array of token ids, an int64 array with the offset of
+the start of each document in it and a table of the token string of each id (see TokenTable). The arrays are saved as
+.npy files that can be memory-mapped, so loading a corpus doesn't unpickle any Python strings and a document is a slice
+(a view, not a copy) of the token id array.
+Command to pack documents: PackedCorpus.from_docs(docs).save('Stored/DocsVocab/trainingdocs')
+"""
+import os
+import numpy as np
+
+
+class TokenTable:
+    """ The token strings of a corpus, the string of token id i is table[i].
+    The tokens are stored as the utf8 bytes of every token one after another and the offset of each token in them. A
+    fixed width numpy string array would make every entry as wide as the longest token (one url or run of dashes in a
+    review would widen the whole vocabulary), here each token only takes its own length.
+
+    The parameters are:
+        blob: uint8 array of the utf8 bytes of the tokens
+        offsets: int64 array of length number of tokens + 1, token i is blob[offsets[i]:offsets[i+1]]
+    """
+
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    @classmethod
+    def from_list(cls, tokens):
+        data = [token.encode('utf8') for token in tokens]
+        return cls(np.frombuffer(b''.join(data), dtype=np.uint8), np.cumsum([0] + [len(token) for token in data], dtype=np.int64))
+
+    def save(self, name):
+        # saves the table as name_blob.npy and name_offsets.npy
+        np.save(name + '_blob', self.blob)
+        np.save(name + '_offsets', self.offsets)
+
+    @classmethod
+    def load(cls, name, mmap_mode='r'):
+        return cls(np.load(name + '_blob.npy', mmap_mode=mmap_mode), np.load(name + '_offsets.npy', mmap_mode=mmap_mode))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.blob[self.offsets[i]:self.offsets[i+1]].tobytes().decode('utf8')
+
+    def take(self, ids):
+        # the strings of an array of token ids
+        blob, offsets = memoryview(self.blob), memoryview(self.offsets)
+        return [blob[offsets[i]:offsets[i+1]].tobytes().decode('utf8') for i in ids.tolist()]
+
+    def tolist(self):
+        data = self.blob.tobytes()
+        offsets = self.offsets.tolist()
+        return [data[start:end].decode('utf8') for start, end in zip(offsets, offsets[1:])]
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+    def extend(self, tokens):
+        # new table with tokens added after the tokens of this table
+        new = TokenTable.from_list(tokens)
+        return TokenTable(np.concatenate([self.blob, new.blob]), np.concatenate([self.offsets, new.offsets[1:] + self.offsets[-1]]))
+
+
+class PackedCorpus:
+    """ Tokenized documents as token ids and document offsets.
+
+    The parameters are:
+        tokens: int32 array of the token ids of every document one after another
+        offsets: int64 array of length number of documents + 1, document i is tokens[offsets[i]:offsets[i+1]]
+        table: TokenTable of the token string of each token id
+    """
+
+    def __init__(self, tokens, offsets, table):
+        self.tokens = tokens
+        self.offsets = offsets
+        self.table = table
+
+    @classmethod
+    def from_docs(cls, docs, table=None):
+        # packs a list of tokenized documents, the ids of new tokens are added to the end of table
+        table = list(table) if table is not None else []
+        token_ids = {token: i for i, token in enumerate(table)}
+        tokens = []
+        offsets = [0]
+        for doc in docs:
+            for token in doc:
+                if token not in token_ids:
+                    token_ids[token] = len(table)
+                    table.append(token)
+                tokens.append(token_ids[token])
+            offsets.append(len(tokens))
+        return cls(np.array(tokens, dtype=np.int32), np.array(offsets, dtype=np.int64), TokenTable.from_list(table))
+
+    def save(self, name):
+        # saves the corpus as a folder of .npy files
+        os.makedirs(name, exist_ok=True)
+        for array_name in ['tokens', 'offsets']:
+            np.save(os.path.join(name, array_name), getattr(self, array_name))
+        self.table.save(os.path.join(name, 'table'))
+
+    @classmethod
+    def load(cls, name, mmap_mode='r'):
+        # opens a corpus saved with save, the arrays are memory-mapped unless mmap_mode is None
+        return cls(*[np.load(os.path.join(name, array_name + '.npy'), mmap_mode=mmap_mode) for array_name in ['tokens', 'offsets']],
+                   TokenTable.load(os.path.join(name, 'table'), mmap_mode=mmap_mode))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        # token ids of document i (a view of the token id array)
+        return self.tokens[self.offsets[i]:self.offsets[i+1]]
+
+    def doc(self, i):
+        # tokens of document i as strings
+        return self.table.take(self[i])
+
+    def __iter__(self):
+        # iterates over the documents as lists of token strings
+        for i in range(len(self)):
+            yield self.doc(i)
+
+    def extend(self, docs):
+        # new corpus with docs added after the documents of this corpus
+        new = PackedCorpus.from_docs(docs, self.table)
+        return PackedCorpus(np.concatenate([self.tokens, new.tokens]), np.concatenate([self.offsets, new.offsets[1:] + self.offsets[-1]]), new.table)
+
+    def doc_ids(self):
+        # document index of every token
+        return np.repeat(np.arange(len(self)), np.diff(self.offsets))
+
+    def column_lookup(self, vocab_dict):
+        # array with the column of each token id in vocab_dict (-1 for tokens that are not in vocab_dict)
+        return np.array([vocab_dict[token] if token in vocab_dict else -1 for token in self.table.tolist()], dtype=np.int64)
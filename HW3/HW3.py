@@ -31,6 +31,7 @@ import torch.nn as nn
 import gc
 from sklearn.metrics import accuracy_score
 from conlleval import evaluate_conll_file
+from embeddingcache import EmbeddingCache
 import math
 
 start_time = time.time()
@@ -197,29 +198,17 @@ def build_weights_matrix(vocab, embedding_file, embedding_dim):
     used to apply pretrained embeddigns to vocabulary
     """
     print("--- Building Pretrained Embedding Index  --- %s seconds ---" % (round((time.time() - start_time),2)))
-    words = []
-    embeddings_index = {}
-    with open (embedding_file, encoding="utf8") as f:
-        for line in f:
-            values = line.split()
-            word = values[0]
-            words.append(word)
-            embedding = np.asarray(values[1:], dtype='float32')
-            embeddings_index[word] = embedding
+    embeddings_index = EmbeddingCache.open(embedding_file) #converted once to a memory-mapped cache (see embeddingcache)
 
     
     matrix_len = len(vocab)
     weights_matrix = np.zeros((matrix_len, embedding_dim)) # 200 is depth of embedding matrix
-    words_found = 0
-    words_not_found = 0
-    for i, word in enumerate(vocab):
-        try:
-            weights_matrix[i] = embeddings_index[word] #assign the pretrained embedding
-            words_found += 1
-        
-        except KeyError:
-            weights_matrix[i] = np.random.normal(scale=0.6, size=(embedding_dim,)) #randomize out of vocabulary words
-            words_not_found += 1
+    rows = embeddings_index.find_rows(vocab) #row of every vocabulary word in the embeddings (-1 if it isn't in them)
+    found = rows >= 0
+    weights_matrix[found] = embeddings_index.vectors[rows[found]] #assign the pretrained embedding
+    weights_matrix[~found] = np.random.normal(scale=0.6, size=((~found).sum(), embedding_dim)) #randomize out of vocabulary words
+    words_found = int(found.sum())
+    words_not_found = matrix_len - words_found
             
     print("{:.2f}% ({}/{}) of the vocabulary were in the pre-trained embedding.".format((words_found/len(vocab))*100,words_found,len(vocab)))
     return torch.from_numpy(weights_matrix)
@@ -30,6 +30,8 @@ from nltk.util import ngrams
 from nltk import word_tokenize, sent_tokenize
 from nltk.stem.lancaster import LancasterStemmer
 from nltk.stem import PorterStemmer, SnowballStemmer
+from stemcache import StemCache
+from embeddingcache import EmbeddingCache
 from collections import defaultdict
 from sklearn.metrics import confusion_matrix
 from sklearn.model_selection import train_test_split, StratifiedKFold
@@ -51,6 +53,10 @@ from sklearn.decomposition import PCA
 localfolder = 'kaggle/input/quora-insincere-questions-classification/'
 kagglefolder = '/kaggle/input/quora-insincere-questions-classification/'
 start_time = time.time()
+#stem caches shared by every call to build_weights_matrix
+porter_stemmer = StemCache(PorterStemmer())
+lancaster_stemmer = StemCache(LancasterStemmer())
+snowball_stemmer = StemCache(SnowballStemmer("english"))
 
 
 def main():
@@ -210,18 +216,11 @@ def build_weights_matrix(vocab, embedding_file, wordindex, embed_type):
     """
     used to apply pretrained embeddings to vocabulary
     """
-    ps = PorterStemmer()
-    lc = LancasterStemmer()
-    sb = SnowballStemmer("english")
     print("--- Building Pretrained Embedding Index  --- %s seconds ---" % (round((time.time() - start_time),2)))
     
-    embeddings_index = {}
-    with open (embedding_file, encoding="utf8", errors='ignore') as f:
-        for line in f:
-            values = line.split(" ")
-            embeddings_index[values[0]] = np.asarray(values[1:], dtype='float32')
+    embeddings_index = EmbeddingCache.open(embedding_file, errors='ignore') #converted once to a memory-mapped cache (see embeddingcache)
     
-    embedding_dim = embeddings_index[values[0]].shape[0]
+    embedding_dim = embeddings_index.dim
     matrix_len = len(vocab)
     if embed_type == 'glove':
         embed_mean, embed_std = -0.00584, 0.48782
@@ -232,51 +231,21 @@ def build_weights_matrix(vocab, embedding_file, wordindex, embed_type):
     # found will be placed in a random normal matrix
     weights_matrix = np.random.normal(embed_mean, embed_std, (matrix_len, embedding_dim))
     #weights_matrix = np.zeros((matrix_len, embedding_dim)) 
-    words_found = 0
-    words_not_found = 0
     # assigning pretrained embeddings
-    for i, word in tqdm(wordindex.items()):
-        word = "".join(word)
-        if embeddings_index.get(word) is not None:
-            weights_matrix[i] = embeddings_index[word] #assign the pretrained embedding
-            words_found += 1
-            continue
-        # if the word in the vocab doesn't match anything in the pretrained embedding,
-        # we are adjusting the word to see if any adjustment matches a word in the embedding
-        adjusted_word = word.lower()
-        if embeddings_index.get(adjusted_word) is not None:
-            weights_matrix[i] = embeddings_index[adjusted_word] 
-            words_found += 1
-            continue
-        adjusted_word = word.upper()
-        if embeddings_index.get(adjusted_word) is not None:
-            weights_matrix[i] = embeddings_index[adjusted_word] 
-            words_found += 1
-            continue
-        adjusted_word = word.capitalize()
-        if embeddings_index.get(adjusted_word) is not None:
-            weights_matrix[i] = embeddings_index[adjusted_word]
-            words_found += 1
-            continue
-        adjusted_word = ps.stem(word)
-        if embeddings_index.get(adjusted_word) is not None:
-            weights_matrix[i] = embeddings_index[adjusted_word] 
-            words_found += 1
-            continue
-        adjusted_word = lc.stem(word)
-        if embeddings_index.get(adjusted_word) is not None:
-            weights_matrix[i] = embeddings_index[adjusted_word] 
-            words_found += 1
-            continue
-        adjusted_word = sb.stem(word)
-        if embeddings_index.get(adjusted_word) is not None:
-            weights_matrix[i] = embeddings_index[adjusted_word] 
-            words_found += 1
-            continue
-        
-        # if the word still isn't in the embedding, even after trying all the 
-        # adjustments, then we assign it a random normal set of numbers
-        words_not_found += 1
+    # if the word in the vocab doesn't match anything in the pretrained embedding,
+    # we are adjusting the word to see if any adjustment matches a word in the embedding
+    # every adjustment is looked up at once for all of the words that haven't been found yet (see EmbeddingCache.find_rows)
+    indices = np.array(list(wordindex.keys()), dtype=np.int64)
+    words = ["".join(word) for word in wordindex.values()]
+    adjustments = [lambda word: word, str.lower, str.upper, str.capitalize, porter_stemmer.stem, lancaster_stemmer.stem, snowball_stemmer.stem]
+    rows = np.full(len(words), -1)
+    for adjust in tqdm(adjustments):
+        missing = np.flatnonzero(rows < 0)
+        rows[missing] = embeddings_index.find_rows([adjust(words[j]) for j in missing])
+    found = rows >= 0
+    weights_matrix[indices[found]] = embeddings_index.vectors[rows[found]] #assign the pretrained embedding
+    words_found = int(found.sum())
+    words_not_found = len(words) - words_found
             
     print("{:.2f}% ({}/{}) of the vocabulary was in the pre-trained embedding.".format((words_found/len(vocab))*100,words_found,len(vocab)))
     return torch.from_numpy(weights_matrix)
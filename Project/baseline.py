@@ -21,6 +21,7 @@ from sklearn.model_selection import GridSearchCV
 from sklearn.metrics import precision_recall_fscore_support
 from nltk import word_tokenize
 from nltk.stem.porter import PorterStemmer
+from stemcache import StemCache
 from sklearn.base import BaseEstimator, TransformerMixin
 import string
 from sklearn.naive_bayes import GaussianNB
@@ -54,6 +55,8 @@ accuracy = accuracy_score(y, prediction)
 f1_score(y, prediction)
 
 #%% 
+# stem cache shared by the preprocessing of every question
+porter_stemmer = StemCache(PorterStemmer())
 
 #%%
 # creating a mapping for contractions to be tokenized
@@ -76,7 +79,6 @@ class TextPreprocess(BaseEstimator, TransformerMixin):
         # removing punctuation
         X = X.apply(lambda a: [t for t in a if t not in string.punctuation])
         # stemming the words
-        porter_stemmer = PorterStemmer()
         X = X.apply(lambda r: [porter_stemmer.stem(word) for word in r])
         X = pd.Series([" ".join(i) for i in X])
         return X
@@ -0,0 +1,154 @@
+"""
+Binary cache of pretrained word embeddings.
+Parsing a GloVe or word2vec text file (glove.840B.300d.txt is over 5 GB) into a dictionary of arrays takes minutes on
+every run. The text file is converted once into a float32 matrix with one row per word (vectors.bin) and an index of the
+words sorted by a 64 bit hash of each word: the hashes (hashes.npy), the utf8 bytes of every word one after another
+(blob.npy), the offset of each word in blob (offsets.npy) and the row of each word in the matrix (rows.npy). Every file
+is memory-mapped when the cache is opened, so opening it takes milliseconds. The words of a whole vocabulary are looked
+up at once with one searchsorted of their hashes (find_rows) and only the pages of the rows that are used are read.
+Command to use an embedding file: embeddings_index = EmbeddingCache.open('glove.6B.200d.txt'); embeddings_index.find_rows(vocab)
+HW2/embeddingcache.py is the original, the copies in HW3, HW4 and Project are the same file (like stemcache.py) -- change
+the HW2 file and copy it over the others.
+"""
+import os
+import hashlib
+import numpy as np
+
+
+def word_hash(word):
+    # 64 bit hash of the utf8 bytes of a word (python's hash() changes between runs, so it can't be stored)
+    return int.from_bytes(hashlib.blake2b(word, digest_size=8).digest(), 'little')
+
+class EmbeddingCache:
+    """ Pretrained word embeddings read from a cache made by convert. find_rows looks up many words at once, for single
+        words it also works like the dictionary of word embeddings: embeddings_index[word] (KeyError if the word isn't in
+        the embeddings), embeddings_index.get(word) and word in embeddings_index.
+
+    The parameters are:
+        vectors: (number of words, dim) float32 matrix of the embeddings
+        hashes: sorted uint64 array of the word hashes (see word_hash)
+        blob: uint8 array of the utf8 bytes of the words in the order of hashes
+        offsets: int64 array of length number of words + 1, the i-th word is blob[offsets[i]:offsets[i+1]]
+        rows: int64 array of the row in vectors of each word
+    """
+
+    files = ['hashes', 'blob', 'offsets', 'rows']
+
+    def __init__(self, vectors, hashes, blob, offsets, rows):
+        self.vectors = vectors
+        self.hashes = hashes
+        self.blob = blob
+        self.offsets = offsets
+        self.rows = rows
+        self.dim = vectors.shape[1]
+
+    @staticmethod
+    def cache_folder(embedding_file):
+        # the cache of glove.6B.200d.txt is the folder glove.6B.200d_cache next to it
+        return os.path.splitext(embedding_file)[0] + '_cache'
+
+    @classmethod
+    def convert(cls, embedding_file, cache=None, errors='strict'):
+        '''
+        Converts a GloVe or word2vec text embedding file to a cache folder. The word2vec header line (number of words and
+        dimensions) is skipped. The last dim values of a line are the vector and the rest is the word, so words that
+        contain spaces (there are some in glove.840B.300d) are kept whole. If a word is in the file twice the last
+        vector is used, like when the lines are put in a dictionary.
+        '''
+        cache = cache or cls.cache_folder(embedding_file)
+        os.makedirs(cache, exist_ok=True)
+        word_rows = {}
+        n_rows = 0
+        dim = None
+        with open(embedding_file, encoding='utf8', errors=errors) as f, open(os.path.join(cache, 'vectors.bin'), 'wb') as out:
+            for n, line in enumerate(f):
+                values = line.rstrip().split(' ')
+                if n == 0 and len(values) == 2 and all(value.isdigit() for value in values):
+                    dim = int(values[1]) #word2vec header
+                    continue
+                if dim is None:
+                    dim = len(values) - 1
+                if len(values) <= dim:
+                    continue #empty or broken line
+                out.write(np.asarray(values[-dim:], dtype=np.float32).tobytes())
+                word_rows[' '.join(values[:-dim]).encode('utf8')] = n_rows
+                n_rows += 1
+        # sort the words by their hash (words with the same hash by the word) so they can be found with searchsorted
+        index = sorted((word_hash(word), word, row) for word, row in word_rows.items())
+        np.save(os.path.join(cache, 'hashes'), np.array([h for h, word, row in index], dtype=np.uint64))
+        np.save(os.path.join(cache, 'blob'), np.frombuffer(b''.join(word for h, word, row in index), dtype=np.uint8))
+        np.save(os.path.join(cache, 'offsets'), np.cumsum([0] + [len(word) for h, word, row in index], dtype=np.int64))
+        np.save(os.path.join(cache, 'rows'), np.array([row for h, word, row in index], dtype=np.int64))
+        np.save(os.path.join(cache, 'shape'), np.array([n_rows, dim], dtype=np.int64)) #saved last, it marks a finished cache
+        return cls.load(cache)
+
+    @classmethod
+    def load(cls, cache):
+        # opens a cache folder made by convert, every array is memory-mapped
+        shape = tuple(np.load(os.path.join(cache, 'shape.npy')))
+        vectors = np.memmap(os.path.join(cache, 'vectors.bin'), dtype=np.float32, mode='r', shape=shape)
+        return cls(vectors, *[np.load(os.path.join(cache, name + '.npy'), mmap_mode='r') for name in cls.files])
+
+    @classmethod
+    def open(cls, embedding_file, cache=None, errors='strict'):
+        '''
+        Opens the cache of embedding_file and converts the file first if there is no cache or the file is newer than it.
+        Once the cache exists the text file isn't needed anymore.
+        '''
+        cache = cache or cls.cache_folder(embedding_file)
+        shape_file = os.path.join(cache, 'shape.npy')
+        if (not all(os.path.exists(os.path.join(cache, name + '.npy')) for name in cls.files + ['shape'])
+                or (os.path.exists(embedding_file) and os.path.getmtime(embedding_file) > os.path.getmtime(shape_file))):
+            print('Converting %s to %s' % (embedding_file, cache))
+            return cls.convert(embedding_file, cache, errors)
+        return cls.load(cache)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def word(self, i):
+        # the i-th word of the index as bytes
+        return self.blob[self.offsets[i]:self.offsets[i+1]].tobytes()
+
+    def find_rows(self, words):
+        '''
+        The row in vectors of every word in words, -1 for the words that aren't in the embeddings. All of the hashes are
+        looked up with one searchsorted, only the words whose hash is found are compared with the stored word.
+        '''
+        keys = [word.encode('utf8') for word in words]
+        rows = np.full(len(keys), -1, dtype=np.int64)
+        if not len(self) or not keys:
+            return rows
+        hashes = np.fromiter((word_hash(key) for key in keys), dtype=np.uint64, count=len(keys))
+        positions = np.minimum(np.searchsorted(self.hashes, hashes), len(self) - 1)
+        found = np.flatnonzero(self.hashes[positions] == hashes)
+        # compare the word at the position of each found hash (read through a memoryview, much faster than the array)
+        blob = memoryview(self.blob)
+        starts = self.offsets[positions[found]].tolist()
+        ends = self.offsets[positions[found] + 1].tolist()
+        for i, start, end, row in zip(found.tolist(), starts, ends, self.rows[positions[found]].tolist()):
+            if blob[start:end] == keys[i]:
+                rows[i] = row
+                continue
+            # different words with the same hash are next to each other in the index
+            position = int(positions[i]) + 1
+            while position < len(self) and self.hashes[position] == hashes[i]:
+                if self.word(position) == keys[i]:
+                    rows[i] = self.rows[position]
+                    break
+                position += 1
+        return rows
+
+    def get(self, word, default=None):
+        row = self.find_rows([word])[0]
+        return self.vectors[row] if row >= 0 else default
+
+    def __contains__(self, word):
+        return self.find_rows([word])[0] >= 0
+
+    def __getitem__(self, word):
+        # vector of word, KeyError if the word isn't in the embeddings
+        row = self.find_rows([word])[0]
+        if row < 0:
+            raise KeyError(word)
+        return self.vectors[row]
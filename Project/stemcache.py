@@ -0,0 +1,48 @@
+"""
+Memoized stemming for the nltk stemmers.
+A word always has the same stem, and the words in a corpus follow a Zipf distribution, so after the first few
+documents nearly every token has already been stemmed once. StemCache remembers the stem of each surface form
+in a bounded LRU cache so the stemmer only runs on words that have not been seen yet.
+Command to check the cache: print(stemmer.cache_info())
+"""
+from functools import lru_cache
+
+
+class StemCache:
+    """ Wraps an nltk stemmer (PorterStemmer, LancasterStemmer, SnowballStemmer) with an LRU cache
+        keyed by the surface form of the word.
+
+    The parameters are:
+        stemmer: stemmer with a stem(word) method
+        maxsize: maximum number of words kept in the cache, the least recently used words are
+                 dropped first (None keeps every word)
+    """
+
+    def __init__(self, stemmer, maxsize=2**18):
+        self.stemmer = stemmer
+        self.maxsize = maxsize
+        self.stem = lru_cache(maxsize=maxsize)(stemmer.stem)
+
+    def __getstate__(self):
+        # the lru_cache wrapper can't be pickled -- only the stemmer is sent to other processes
+        return {'stemmer': self.stemmer, 'maxsize': self.maxsize}
+
+    def __setstate__(self, state):
+        self.__init__(state['stemmer'], state['maxsize'])
+
+    @property
+    def hits(self):
+        # number of words that were already in the cache
+        return self.stem.cache_info().hits
+
+    @property
+    def misses(self):
+        # number of words that had to be stemmed
+        return self.stem.cache_info().misses
+
+    def cache_info(self):
+        # hits, misses, maxsize and current size of the cache
+        return self.stem.cache_info()
+
+    def cache_clear(self):
+        self.stem.cache_clear()